@@ -0,0 +1,66 @@
+"""Time-aware alignment of stock bars with hourly search trends.
+
+Step 3 of the notebook joined the two frames with
+``pd.concat([stock, trends], axis=1).dropna(how='any')``. That builds the
+full outer union of both indexes only to throw away every hour that is
+not in both, and a stock bar stamped a few minutes off the hour is lost.
+``align_asof`` walks the two sorted indexes once with ``pd.merge_asof``,
+matching each stock bar to the nearest search trends row within a
+tolerance, and reports how many rows matched and how many were dropped.
+
+With ``tolerance='0min'`` the result is the same as the old
+concat/dropna for frames with unique timestamps.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def align_asof(left, right, tolerance='30min', direction='nearest', stats=None):
+    """Attach to each row of ``left`` the matching row of ``right``.
+
+    Both frames are date-indexed. ``direction`` is ``'backward'`` (latest
+    ``right`` row at or before the ``left`` timestamp), ``'forward'`` or
+    ``'nearest'``, and matches further apart than ``tolerance`` are
+    dropped, as are rows with missing values. The result keeps ``left``'s
+    index. Sorted inputs are merged in linear time; unsorted ones are
+    sorted first.
+
+    If a ``stats`` dict is passed, it is filled in with ``left_rows``,
+    ``right_rows``, ``matched`` (rows kept, of which ``matched_exact`` had
+    identical timestamps), ``dropped_missing`` (matched but dropped for
+    missing values), ``dropped_left`` and ``unused_right``. All counts
+    refer to the rows that survive the missing-value filter.
+    """
+    if not left.index.is_monotonic_increasing:
+        left = left.sort_index()
+    if not right.index.is_monotonic_increasing:
+        right = right.sort_index()
+
+    # Carry the matched row's position along so the match can be audited
+    position = '__right_position'
+    tagged = right.assign(**{position: np.arange(len(right))})
+    merged = pd.merge_asof(
+        left, tagged,
+        left_index=True, right_index=True,
+        tolerance=pd.Timedelta(tolerance),
+        direction=direction,
+    )
+
+    matched = merged[position].notna().to_numpy()
+    kept = matched & merged.drop(columns=position).notna().all(axis=1).to_numpy()
+    positions = merged[position].to_numpy()[kept].astype(np.int64)
+    aligned = merged.loc[kept].drop(columns=position)
+
+    if stats is not None:
+        exact = right.index.to_numpy()[positions] == merged.index.to_numpy()[kept]
+        stats.update({
+            'left_rows': len(left),
+            'right_rows': len(right),
+            'matched': len(aligned),
+            'matched_exact': int(exact.sum()),
+            'dropped_missing': int(matched.sum() - kept.sum()),
+            'dropped_left': len(left) - len(aligned),
+            'unused_right': len(right) - len(np.unique(positions)),
+        })
+    return aligned
@@ -0,0 +1,241 @@
+"""Vectorized anomaly detection for hourly search series.
+
+Step 1 of the notebook finds unusual activity by hand: it slices May 2020
+and compares its total with the median monthly total. ``detect_anomalies``
+does the same kind of comparison for every hour, day and month of every
+series at once.
+
+Each series is first averaged onto the level's grid (hourly, daily or
+monthly means of the observed hours; periods with less than
+``min_coverage`` of their hours observed are left out). The expected value
+of each point is the median of the same point in the previous seasonal
+cycles -- the same hour of the week over the last 4 weeks, the same
+weekday over the last 8 weeks, the previous 12 months -- and the scale is
+the MAD of the residuals over that same trailing window:
+
+    score = (value - expected) / (1.4826 * MAD of earlier residuals)
+
+The reference values for all series are built as one stack of shifted
+arrays and the MAD is a rolling median over every series at once, so the
+scores take a few array operations per block of series. A score only
+depends on the last two windows, so passing ``since`` scores just the
+newest data, which is what an hourly job needs.
+``residual_anomalies`` scores hours against a fitted Prophet forecast
+instead, using the width of its uncertainty interval as the scale.
+
+Consecutive flagged points of one series in the same direction are merged
+into one event, and events are ranked by their largest ``|score|``.
+``near_dates`` attaches the nearest date from a calendar of events, such
+as earnings releases.
+"""
+
+import warnings
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+
+# Level -> (grid frequency, seasonal period in grid steps, cycles compared)
+LEVELS = {
+    'hour': ('h', 168, 4),
+    'day': ('D', 7, 8),
+    'month': (pd.offsets.MonthEnd(), 1, 12),
+}
+EVENT_COLUMNS = ['rank', 'series_id', 'level', 'method', 'start', 'end', 'points', 'direction',
+                 'score', 'value', 'expected']
+
+# MAD of a normal sample, in standard deviations
+_MAD_SCALE = 1.4826
+# Cap on the size of the (cycles, series, time) reference stack per block
+_BLOCK_ELEMENTS = 2 ** 24
+
+
+def _as_wide(data):
+    # Accept a date-indexed frame (one column per series) or a compact.SeriesStore
+    if isinstance(data, pd.DataFrame):
+        return data
+    values = data.fields['y']
+    return pd.DataFrame(values.T, index=pd.DatetimeIndex(data.ds), columns=data.ids)
+
+
+def _level_grid(wide, freq, min_coverage):
+    # Mean of the observed hours per period; poorly covered periods become NaN
+    resampled = wide.resample(freq)
+    means = resampled.mean()
+    if freq == 'h':
+        return means
+    counts = resampled.count().to_numpy()
+    hours = 24 * (means.index.days_in_month.to_numpy() if freq != 'D' else np.ones(len(means)))
+    return means.where(counts >= min_coverage * hours[:, None])
+
+
+def robust_scores(values, period, cycles, min_cycles=None, min_scale=0.05):
+    """Seasonal robust z-scores of ``values`` (shape ``(series, time)``).
+
+    Each point's ``expected`` value is the median of the points ``period``,
+    ``2 * period``, ... ``cycles * period`` steps earlier, and its scale is
+    the MAD of the residuals of the ``period * cycles`` points before it.
+    Returns ``(score, expected)``; points with fewer than ``min_cycles``
+    (default: half of ``cycles``) earlier values get NaN. The scale is
+    floored at ``min_scale`` times ``|expected|`` so a flat history does
+    not make every change infinitely unusual.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    min_cycles = max(1, cycles // 2) if min_cycles is None else min_cycles
+    n_series, n_time = values.shape
+    score = np.full(values.shape, np.nan)
+    expected = np.full(values.shape, np.nan)
+    window = period * cycles
+    block = max(1, _BLOCK_ELEMENTS // max(1, cycles * n_time))
+
+    for first in range(0, n_series, block):
+        rows = slice(first, first + block)
+        current = values[rows]
+        reference = np.full((cycles,) + current.shape, np.nan)
+        for j in range(1, cycles + 1):
+            lag = j * period
+            if lag < n_time:
+                reference[j - 1, :, lag:] = current[:, :n_time - lag]
+        enough = (~np.isnan(reference)).sum(axis=0) >= min_cycles
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            # Points without any earlier cycle are expected at the start of a series
+            warnings.filterwarnings('ignore', 'All-NaN slice', RuntimeWarning)
+            median = np.nanmedian(reference, axis=0)
+            residual = pd.DataFrame(np.abs(current - median).T)
+            mad = residual.rolling(window, min_periods=max(1, window // 2)).median().shift(1)
+            scale = np.maximum(_MAD_SCALE * mad.to_numpy().T, min_scale * np.abs(median))
+            scale = np.where(scale > 0, scale, np.nan)
+            block_score = (current - median) / scale
+        score[rows] = np.where(enough, block_score, np.nan)
+        expected[rows] = np.where(enough, median, np.nan)
+    return score, expected
+
+
+def _events(score, values, expected, index, ids, level, method, threshold, since=None):
+    # Merge consecutive flagged points of a series (same direction) into events
+    flagged = np.abs(np.nan_to_num(score)) >= threshold
+    rows, cols = np.nonzero(flagged)
+    if len(rows) == 0:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    sign = np.sign(score[rows, cols])
+    new = np.ones(len(rows), dtype=bool)
+    new[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1] + 1) | (sign[1:] != sign[:-1])
+    event = np.cumsum(new) - 1
+
+    points = pd.DataFrame({
+        'event': event,
+        'row': rows,
+        'start': index[cols],
+        'abs_score': np.abs(score[rows, cols]),
+        'score': score[rows, cols],
+        'value': values[rows, cols],
+        'expected': expected[rows, cols],
+    })
+    grouped = points.groupby('event', sort=False)
+    peak = points.loc[grouped['abs_score'].idxmax()].set_index('event')
+    events = pd.DataFrame({
+        'series_id': ids[grouped['row'].first().to_numpy()],
+        'level': level,
+        'method': method,
+        'start': grouped['start'].min().to_numpy(),
+        'end': grouped['start'].max().to_numpy(),
+        'points': grouped.size().to_numpy(),
+        'direction': np.where(peak['score'].to_numpy() > 0, 'spike', 'drop'),
+        'score': peak['score'].to_numpy(),
+        'value': grouped['value'].sum().to_numpy(),
+        'expected': grouped['expected'].sum().to_numpy(),
+    })
+    if since is not None:
+        events = events[events['end'] >= pd.Timestamp(since)]
+    return events
+
+
+def _rank(frames):
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    events = pd.concat(frames, ignore_index=True)
+    events = events.iloc[np.argsort(-events['score'].abs().to_numpy(), kind='stable')]
+    events.insert(0, 'rank', np.arange(1, len(events) + 1))
+    return events.reset_index(drop=True)[EVENT_COLUMNS]
+
+
+def _lookback_start(since, level):
+    freq, period, cycles = LEVELS[level]
+    since = pd.Timestamp(since)
+    # One window for the expected values and one for the scale of their residuals
+    if level == 'month':
+        return since.to_period('M').start_time - pd.DateOffset(months=2 * period * cycles)
+    step = pd.Timedelta(1, freq)
+    return since.floor(step) - 2 * period * cycles * step
+
+
+def detect_anomalies(data, levels=('hour', 'day', 'month'), threshold=4.0, since=None,
+                     min_coverage=0.5):
+    """Ranked table of unusual hours, days and months across every series.
+
+    ``data`` is a date-indexed frame with one column per series (or a
+    ``compact.SeriesStore``). Each event has the series id, level, first
+    and last period (``start``/``end``, labelled as the level's grid is),
+    the number of flagged ``points``, ``direction`` (``'spike'`` or
+    ``'drop'``), the largest-magnitude ``score`` and the summed ``value``
+    and ``expected`` means of the flagged periods. With ``since``, only
+    the history the scores need is read and only events ending at or
+    after ``since`` are returned.
+    """
+    wide = _as_wide(data).sort_index()
+    ids = np.asarray(wide.columns, dtype=object)
+    frames = []
+    for level in levels:
+        freq, period, cycles = LEVELS[level]
+        source = wide if since is None else wide.loc[_lookback_start(since, level):]
+        grid = _level_grid(source, freq, min_coverage)
+        values = grid.to_numpy(dtype=np.float64).T
+        score, expected = robust_scores(values, period, cycles)
+        frames.append(_events(score, values, expected, grid.index, ids, level, 'seasonal_mad',
+                              threshold, since))
+    return _rank(frames)
+
+
+def residual_anomalies(actuals, forecasts, threshold=4.0, interval_width=0.8, since=None):
+    """Ranked table of hours that fall far outside a fitted Prophet forecast.
+
+    ``actuals`` is a date-indexed frame with one column per series (or a
+    ``compact.SeriesStore``). ``forecasts`` is a ``compact.SeriesStore``
+    with ``yhat``/``yhat_lower``/``yhat_upper`` fields, or anything
+    ``SeriesStore.from_forecasts`` accepts. The score is the residual
+    divided by the standard deviation implied by the interval.
+    """
+    from compact import SeriesStore
+
+    if not isinstance(forecasts, SeriesStore):
+        forecasts = SeriesStore.from_forecasts(forecasts)
+    index = pd.DatetimeIndex(forecasts.ds)
+    wide = _as_wide(actuals).reindex(index=index, columns=forecasts.ids)
+    values = wide.to_numpy(dtype=np.float64).T
+    yhat = forecasts.fields['yhat'].astype(np.float64)
+    width = (forecasts.fields['yhat_upper'] - forecasts.fields['yhat_lower']).astype(np.float64)
+    sd = width / (2 * NormalDist().inv_cdf(0.5 + interval_width / 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        score = np.where(sd > 0, (values - yhat) / sd, np.nan)
+    return _rank([_events(score, values, yhat, index, forecasts.ids, 'hour', 'prophet_residual',
+                          threshold, since)])
+
+
+def near_dates(events, dates, tolerance='3D', name='nearest_date'):
+    """Attach to each event the nearest of ``dates`` within ``tolerance`` of its start."""
+    dates = pd.DataFrame({name: pd.to_datetime(pd.Series(dates)).sort_values().to_numpy()})
+    ordered = events.assign(_order=np.arange(len(events))).sort_values('start')
+    ordered['start'] = pd.to_datetime(ordered['start'])
+    joined = pd.merge_asof(ordered, dates, left_on='start', right_on=name, direction='nearest',
+                           tolerance=pd.Timedelta(tolerance))
+    return joined.sort_values('_order').drop(columns='_order').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    from ingest import load_search_trends
+
+    trends = load_search_trends()
+    events = detect_anomalies(trends[['Search Trends']])
+    print(events.head(20).to_string(index=False))
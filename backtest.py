@@ -0,0 +1,200 @@
+"""Rolling-origin backtesting of the Prophet search trends model.
+
+For each cutoff, the model is fitted on every hour up to the cutoff and
+scored on the following ``horizon`` hours (2000 in the notebook): MAE,
+MAPE and the share of actuals inside ``yhat_lower``/``yhat_upper``.
+
+Folds run in parallel worker processes. The series is sent to each worker
+once, through the pool initializer, together with the row positions of
+every cutoff (found with one ``searchsorted`` over the sorted
+timestamps), so a fold task is just a pair of integers and its train and
+test windows are plain ``iloc`` slices of the cached frame.
+
+Cutoffs follow ``prophet.diagnostics.cross_validation``: by default the
+first one leaves ``3 * horizon`` of history and they are spaced
+``horizon / 2`` apart, ending ``horizon`` before the last observation.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import cpu_seconds
+from intervals import predict_with_intervals
+
+
+SCORES = ['mae', 'mape', 'coverage']
+
+# Set in each worker by init_fold_worker
+_FOLD_DATA = None
+
+
+def make_cutoffs(ds, horizon, initial=None, period=None):
+    """Cutoff timestamps for a sorted ``ds`` column, oldest first."""
+    horizon = pd.Timedelta(horizon)
+    initial = 3 * horizon if initial is None else pd.Timedelta(initial)
+    period = horizon / 2 if period is None else pd.Timedelta(period)
+
+    first, last = ds.iloc[0], ds.iloc[-1]
+    cutoff = last - horizon
+    cutoffs = []
+    while cutoff >= first + initial:
+        cutoffs.append(cutoff)
+        cutoff -= period
+    if not cutoffs:
+        raise ValueError('Not enough history for even one cutoff; reduce initial or horizon')
+    return cutoffs[::-1]
+
+
+def fold_windows(ds, cutoffs, horizon):
+    """Row positions ``(train_end, test_end)`` of every fold, from one pass over ``ds``.
+
+    Rows ``[0, train_end)`` are at or before the cutoff and rows
+    ``[train_end, test_end)`` fall within ``horizon`` after it.
+    """
+    values = ds.to_numpy(dtype='datetime64[ns]')
+    cutoffs = np.asarray(cutoffs, dtype='datetime64[ns]')
+    train_end = np.searchsorted(values, cutoffs, side='right')
+    test_end = np.searchsorted(values, cutoffs + np.timedelta64(pd.Timedelta(horizon)), side='right')
+    return list(zip(train_end.tolist(), test_end.tolist()))
+
+
+def prepare_folds(df, horizon='2000h', initial=None, period=None, cutoffs=None):
+    """Clean and sort a ``ds``/``y`` frame and compute its fold windows."""
+    df = df[['ds', 'y']].dropna().sort_values('ds').reset_index(drop=True)
+    if cutoffs is None:
+        cutoffs = make_cutoffs(df['ds'], horizon, initial, period)
+    return df, fold_windows(df['ds'], cutoffs, horizon)
+
+
+def init_fold_worker(df, prophet_kwargs=None, interval_mode='analytic', design_cache=None):
+    """Pool initializer that caches the series and settings in the worker.
+
+    With a ``design_cache`` directory, the worker reads Prophet's Fourier
+    features from a shared ``design_cache.FourierCache`` there.
+    """
+    global _FOLD_DATA
+    from forecasting import quiet_stan_logs
+
+    quiet_stan_logs()
+    if design_cache is not None:
+        from design_cache import install
+
+        install(design_cache)
+    _FOLD_DATA = (df, prophet_kwargs, interval_mode)
+
+
+def score_forecast(y, yhat, lower, upper):
+    """MAE, MAPE (over non-zero actuals) and interval coverage.
+
+    Coverage is taken over the rows that have both bounds, and is NaN when
+    none do (e.g. with ``interval_mode='none'``).
+    """
+    errors = np.abs(y - yhat)
+    nonzero = y != 0
+    bounded = ~(np.isnan(lower) | np.isnan(upper))
+    inside = (y[bounded] >= lower[bounded]) & (y[bounded] <= upper[bounded])
+    return {
+        'mae': float(errors.mean()),
+        'mape': float((errors[nonzero] / np.abs(y[nonzero])).mean()) if nonzero.any() else np.nan,
+        'coverage': float(inside.mean()) if bounded.any() else np.nan,
+    }
+
+
+def run_fold(fold, train_end, test_end, prophet_kwargs=None):
+    """Fit and score one fold in a worker set up by ``init_fold_worker``.
+
+    ``prophet_kwargs`` overrides the worker's default settings for this fold.
+    An error in the fit or predict is returned in the row's ``error``
+    (with NaN scores) rather than raised, so one bad fold cannot take down
+    the run.
+    """
+    from prophet import Prophet
+
+    df, default_kwargs, interval_mode = _FOLD_DATA
+    prophet_kwargs = default_kwargs if prophet_kwargs is None else prophet_kwargs
+    train = df.iloc[:train_end]
+    test = df.iloc[train_end:test_end]
+
+    start = time.perf_counter()
+    cpu_start = cpu_seconds()
+    try:
+        model = Prophet(**(prophet_kwargs or {}))
+        model.fit(train)
+        forecast = predict_with_intervals(model, test[['ds']], mode=interval_mode)
+        scores = score_forecast(test['y'].to_numpy(), forecast['yhat'].to_numpy(),
+                                forecast['yhat_lower'].to_numpy(), forecast['yhat_upper'].to_numpy())
+        error = None
+    except Exception as exc:
+        scores = dict.fromkeys(SCORES, np.nan)
+        error = f'{type(exc).__name__}: {exc}'
+    elapsed = time.perf_counter() - start
+    cpu = cpu_seconds() - cpu_start
+    return {'fold': fold, 'cutoff': train['ds'].iloc[-1], 'train_rows': len(train),
+            'test_rows': len(test), **scores, 'fit_predict_s': elapsed, 'cpu_s': cpu, 'error': error}
+
+
+def failed_fold(df, fold, train_end, test_end, exc):
+    """Row for a fold whose worker died (e.g. killed or out of memory) before returning."""
+    return {'fold': fold, 'cutoff': df['ds'].iloc[train_end - 1], 'train_rows': train_end,
+            'test_rows': test_end - train_end, **dict.fromkeys(SCORES, np.nan),
+            'fit_predict_s': np.nan, 'cpu_s': np.nan, 'error': f'{type(exc).__name__}: {exc}'}
+
+
+def backtest(df, horizon='2000h', initial=None, period=None, cutoffs=None, max_workers=None,
+             prophet_kwargs=None, interval_mode='analytic', design_cache=None):
+    """Rolling-origin evaluation of Prophet on a ``ds``/``y`` frame.
+
+    Returns a frame with one row per fold (cutoff, sizes, ``mae``,
+    ``mape``, ``coverage``, the fold's fit+predict wall and CPU time and
+    its ``error``, None unless the fold failed), ordered by cutoff. ``interval_mode`` is passed to ``predict_with_intervals``;
+    use ``'full'`` for Prophet's own simulated intervals. Every fold is a
+    prefix of the same grid, so a ``design_cache`` directory lets the
+    workers share one set of Fourier features.
+    """
+    df, windows = prepare_folds(df, horizon, initial, period, cutoffs)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=init_fold_worker,
+                             initargs=(df, prophet_kwargs, interval_mode, design_cache)) as pool:
+        futures = {pool.submit(run_fold, fold, train_end, test_end): fold
+                   for fold, (train_end, test_end) in enumerate(windows)}
+        for future in as_completed(futures):
+            try:
+                rows.append(future.result())
+            except Exception as exc:
+                fold = futures[future]
+                rows.append(failed_fold(df, fold, *windows[fold], exc))
+    return pd.DataFrame(rows).sort_values('fold').reset_index(drop=True)
+
+
+def summarize(folds):
+    """Average the fold scores, weighting each fold by its number of test rows.
+
+    Failed folds are left out of the averages and counted in ``failed``.
+    """
+    failed = folds['error'].notna()
+    folds = folds[~failed]
+    weights = folds['test_rows']
+    return {
+        'folds': len(folds),
+        'failed': int(failed.sum()),
+        **{score: float(np.average(folds[score], weights=weights)) if len(folds) else np.nan
+           for score in SCORES},
+        'fit_predict_s': float(folds['fit_predict_s'].sum()),
+        'cpu_s': float(folds['cpu_s'].sum()),
+    }
+
+
+if __name__ == '__main__':
+    from ingest import load_search_trends
+
+    trends = load_search_trends()
+    prophet_df = trends.reset_index().rename(columns={'Date': 'ds', 'Search Trends': 'y'})
+    start = time.perf_counter()
+    folds = backtest(prophet_df)
+    print(folds.to_string(index=False))
+    print(summarize(folds), f'wall {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,280 @@
+"""Stage-by-stage benchmarks of the Net Prophet pipeline at scaled data sizes.
+
+Synthetic hourly search trends and trading-hour stock prices are generated
+at multiples of the size of the real data and written as CSVs in the
+notebook's formats. Each stage of ``net_prophet.py`` is then timed (best
+of ``repeat`` runs) and, in a separate pass, memory-profiled with
+``tracemalloc`` (peak Python/NumPy allocations) and the process's peak
+RSS growth:
+
+* ``csv_load`` / ``csv_load_warm`` -- cold CSV parse and cached reload (``ingest``)
+* ``may_2020_monthly`` -- May 2020 slice total and monthly ``resample`` median
+* ``seasonality`` -- the Step 2 profiles (``seasonality_profiles``)
+* ``align_features`` -- asof alignment and the Step 3 features
+* ``correlation`` -- the Step 3 correlation table and a one-week lag scan
+* ``prophet_fit`` / ``prophet_predict`` -- Step 4 (only up to ``prophet_max_scale``)
+
+Results are written as JSON. Passing ``--compare`` with an earlier results
+file reports every stage that got slower by more than ``--threshold``.
+
+Usage::
+
+    python benchmarks.py --scales 1 10 100 --output bench.json [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import peak_rss_bytes
+
+
+# Approximate row count of google_hourly_search_trends.csv
+BASE_ROWS = 37_000
+# Latest start that keeps the largest series inside pandas' nanosecond range
+LAST_TIMESTAMP = pd.Timestamp('2262-01-01')
+
+
+def make_search_trends(rows, seed=0):
+    """Hourly search trends with daily/weekly seasonality, covering May 2020."""
+    start = min(pd.Timestamp('2016-06-01'), LAST_TIMESTAMP - pd.Timedelta(hours=rows))
+    index = pd.date_range(start, periods=rows, freq='h', name='Date')
+    rng = np.random.default_rng(seed)
+    hours = np.arange(rows)
+    values = (50 + 20 * np.sin(2 * np.pi * hours / 24) + 8 * np.sin(2 * np.pi * hours / 168)
+              + rng.normal(0, 5, rows))
+    return pd.DataFrame({'Search Trends': np.clip(np.rint(values), 0, 100).astype(np.int64)}, index=index)
+
+
+def make_stock_prices(trends_index, seed=1):
+    """A random-walk closing price on weekday trading hours (9:00-16:00) of ``trends_index``."""
+    trading = trends_index[(trends_index.dayofweek < 5) & (trends_index.hour >= 9) & (trends_index.hour <= 16)]
+    rng = np.random.default_rng(seed)
+    close = 300 * np.exp(np.cumsum(rng.normal(0, 0.002, len(trading))))
+    return pd.DataFrame({'close': close}, index=pd.DatetimeIndex(trading, name='date'))
+
+
+def write_dataset(directory, scale, seed=0):
+    """Write the synthetic CSVs for ``scale`` into ``directory``; returns their paths."""
+    import ingest
+
+    trends = make_search_trends(BASE_ROWS * scale, seed)
+    stock = make_stock_prices(trends.index, seed + 1)
+    trends_path = os.path.join(directory, ingest.SEARCH_TRENDS_FILE)
+    stock_path = os.path.join(directory, ingest.STOCK_PRICE_FILE)
+    # The real search trends file uses short US-style dates
+    trends.to_csv(trends_path, date_format='%m/%d/%y %H:%M' if scale == 1 else None)
+    stock.to_csv(stock_path)
+    return trends_path, stock_path
+
+
+# Each stage takes the shared context dict, may add to it, and returns the rows it processed
+
+def _stage_csv_load(ctx):
+    import ingest
+
+    cache_dir = os.path.join(ctx['workdir'], 'cache')
+    ingest.clear_cache(ctx['trends_path'], cache_dir)
+    ingest.clear_cache(ctx['stock_path'], cache_dir)
+    ctx['trends'] = ingest.load_search_trends(ctx['trends_path'], cache_dir=cache_dir)
+    ctx['stock'] = ingest.load_stock_prices(ctx['stock_path'], cache_dir=cache_dir)
+    return len(ctx['trends']) + len(ctx['stock'])
+
+
+def _stage_csv_load_warm(ctx):
+    import ingest
+
+    cache_dir = os.path.join(ctx['workdir'], 'cache')
+    trends = ingest.load_search_trends(ctx['trends_path'], cache_dir=cache_dir)
+    stock = ingest.load_stock_prices(ctx['stock_path'], cache_dir=cache_dir)
+    return len(trends) + len(stock)
+
+
+def _stage_may_2020_monthly(ctx):
+    trends = ctx['trends']
+    may_2020 = trends.loc['2020-05-01':'2020-05-31', 'Search Trends'].sum()
+    monthly = trends.resample('M')['Search Trends'].sum()
+    ctx['may_2020_ratio'] = may_2020 / monthly.median()
+    return len(trends)
+
+
+def _stage_seasonality(ctx):
+    from seasonality import seasonality_profiles
+
+    ctx['profiles'] = seasonality_profiles(ctx['trends'])
+    return len(ctx['trends'])
+
+
+def _stage_align_features(ctx):
+    from align import align_asof
+    from features import notebook_features
+
+    combined = align_asof(ctx['stock'], ctx['trends'])
+    ctx['combined'] = combined.join(notebook_features(combined))
+    return len(ctx['combined'])
+
+
+def _stage_correlation(ctx):
+    from crosscorr import lag_scan
+
+    combined = ctx['combined']
+    combined[['Stock Volatility', 'Lagged Search Trends', 'Hourly Stock Return']].corr()
+    lag_scan(combined, max_lag=168)
+    return len(combined)
+
+
+def _stage_prophet_fit(ctx):
+    from forecasting import quiet_stan_logs
+    from prophet import Prophet
+
+    quiet_stan_logs()
+    prophet_df = ctx['trends'].reset_index().rename(columns={'Date': 'ds', 'Search Trends': 'y'})
+    ctx['model'] = Prophet().fit(prophet_df)
+    return len(prophet_df)
+
+
+def _stage_prophet_predict(ctx):
+    future = ctx['model'].make_future_dataframe(periods=2000, freq='h')
+    ctx['forecast'] = ctx['model'].predict(future)
+    return len(future)
+
+
+STAGES = [
+    ('csv_load', _stage_csv_load),
+    ('csv_load_warm', _stage_csv_load_warm),
+    ('may_2020_monthly', _stage_may_2020_monthly),
+    ('seasonality', _stage_seasonality),
+    ('align_features', _stage_align_features),
+    ('correlation', _stage_correlation),
+    ('prophet_fit', _stage_prophet_fit),
+    ('prophet_predict', _stage_prophet_predict),
+]
+PROPHET_STAGES = {'prophet_fit', 'prophet_predict'}
+# Stages whose context entries a stage reads
+DEPENDS = {
+    'csv_load_warm': ['csv_load'],
+    'may_2020_monthly': ['csv_load'],
+    'seasonality': ['csv_load'],
+    'align_features': ['csv_load'],
+    'correlation': ['align_features'],
+    'prophet_fit': ['csv_load'],
+    'prophet_predict': ['prophet_fit'],
+}
+
+
+def _with_dependencies(stages):
+    needed = set()
+    pending = list(stages)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(DEPENDS.get(name, []))
+    return needed
+
+
+def _measure(fn, ctx, repeat, memory):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = fn(ctx)
+        times.append(time.perf_counter() - start)
+    result = {'seconds': min(times), 'rows': rows}
+    if memory:
+        rss_before = peak_rss_bytes()
+        tracemalloc.start()
+        fn(ctx)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['tracemalloc_peak_bytes'] = peak
+        result['peak_rss_growth_bytes'] = peak_rss_bytes() - rss_before
+    return result
+
+
+def run_benchmarks(scales=(1, 10, 100), stages=None, prophet_max_scale=10, repeat=1, memory=True,
+                   workdir=None):
+    """Run the selected stages at every scale; returns a list of result dicts."""
+    stages = [name for name, _ in STAGES] if stages is None else stages
+    needed = _with_dependencies(stages)
+    workdir = workdir or tempfile.mkdtemp(prefix='net_prophet_bench_')
+    results = []
+    try:
+        for scale in scales:
+            scale_dir = os.path.join(workdir, f'x{scale}')
+            os.makedirs(scale_dir, exist_ok=True)
+            trends_path, stock_path = write_dataset(scale_dir, scale)
+            ctx = {'workdir': scale_dir, 'trends_path': trends_path, 'stock_path': stock_path}
+            for name, fn in STAGES:
+                if name not in needed or (name in PROPHET_STAGES and scale > prophet_max_scale):
+                    continue
+                if name not in stages:
+                    # Only run to set up the context for a selected stage
+                    fn(ctx)
+                    continue
+                measured = _measure(fn, ctx, repeat, memory)
+                results.append({'stage': name, 'scale': scale, **measured})
+                print(f"x{scale:<4} {name:>18}: {measured['seconds']:8.3f}s  {measured['rows']} rows")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold=1.25):
+    """Stages at least ``threshold`` times slower than in ``baseline``."""
+    previous = {(r['stage'], r['scale']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    for r in results:
+        before = previous.get((r['stage'], r['scale']))
+        if before and r['seconds'] / before >= threshold:
+            regressions.append({'stage': r['stage'], 'scale': r['scale'], 'baseline_s': before,
+                                'seconds': r['seconds'], 'ratio': r['seconds'] / before})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--stages', nargs='+', choices=[name for name, _ in STAGES])
+    parser.add_argument('--prophet-max-scale', type=int, default=10,
+                        help='largest scale at which Prophet is fitted')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='skip the memory-profiling pass')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scales, args.stages, args.prophet_max_scale, args.repeat,
+                             not args.no_memory)
+    report = {
+        'created': pd.Timestamp.now(tz='UTC').isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'base_rows': BASE_ROWS,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION x{r['scale']} {r['stage']}: {r['baseline_s']:.3f}s -> "
+                  f"{r['seconds']:.3f}s ({r['ratio']:.2f}x)")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Compact in-memory representation of hourly series and forecasts.
+
+``Prophet.predict`` returns about twenty float64 columns per hour (trend,
+every seasonality term and their bounds), although only ``yhat`` and its
+interval are used. A long-format panel of many series repeats the
+timestamp and the series id on every row. This module provides:
+
+* ``downcast_frame`` -- integer columns to the smallest integer dtype that
+  holds them, and float columns to float32 when the round trip stays
+  within ``rtol``;
+* ``compact_forecast`` -- project a forecast onto the columns that are
+  used and downcast the values;
+* ``SeriesStore`` -- many series on one shared time axis, stored as one
+  2-D array per field (struct of arrays) with NaN where a series has no
+  observation.
+
+The calendar keys from ``seasonality.calendar_keys`` are already int8 /
+int16 arrays, so nothing here adds helper columns to a frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+from forecasting import FORECAST_COLUMNS
+
+
+def _fits_float32(values, rtol):
+    down = values.astype(np.float32)
+    with np.errstate(over='ignore', invalid='ignore'):
+        return np.allclose(down.astype(np.float64), values, rtol=rtol, atol=0, equal_nan=True), down
+
+
+def downcast_frame(df, rtol=1e-6):
+    """Return a copy of ``df`` with numeric columns in the smallest safe dtype.
+
+    Integer columns become the smallest signed integer dtype that holds
+    their range. Float64 columns become float32 unless that changes any
+    value by more than ``rtol`` relative to it (e.g. values beyond the
+    float32 range). Other columns are left as they are.
+    """
+    out = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_bool_dtype(values) or not pd.api.types.is_numeric_dtype(values):
+            out[column] = values
+        elif pd.api.types.is_integer_dtype(values) and isinstance(values.dtype, np.dtype):
+            out[column] = pd.to_numeric(values, downcast='integer')
+        elif values.dtype == np.float64:
+            ok, down = _fits_float32(values.to_numpy(), rtol)
+            out[column] = pd.Series(down, index=df.index, name=column) if ok else values
+        else:
+            out[column] = values
+    return pd.DataFrame(out, index=df.index, columns=df.columns)
+
+
+def compact_forecast(forecast, columns=FORECAST_COLUMNS, rtol=1e-6):
+    """Keep only ``columns`` of a Prophet forecast and downcast them."""
+    return downcast_frame(forecast[list(columns)], rtol)
+
+
+class SeriesStore:
+    """Many series on one shared, sorted time axis, as struct-of-arrays.
+
+    ``ids`` holds the series ids, ``ds`` the union of their timestamps as
+    ``datetime64[ns]`` and ``fields`` maps each field name (``'y'`` for an
+    input panel, ``'yhat'`` etc. for forecasts) to an array of shape
+    ``(len(ids), len(ds))``. Missing observations are NaN.
+    """
+
+    def __init__(self, ids, ds, fields):
+        self.ids = np.asarray(ids, dtype=object)
+        self.ds = np.asarray(ds, dtype='datetime64[ns]')
+        self.fields = fields
+        self._positions = {series_id: i for i, series_id in enumerate(self.ids)}
+        for name, values in fields.items():
+            if values.shape != (len(self.ids), len(self.ds)):
+                raise ValueError(f'Field {name!r} has shape {values.shape}, '
+                                 f'expected {(len(self.ids), len(self.ds))}')
+
+    @classmethod
+    def from_long(cls, panel, id_col='series_id', value_cols=('y',), dtype=np.float32):
+        """Build a store from a long frame with ``id_col``, ``ds`` and ``value_cols``.
+
+        If an id has several rows at the same timestamp, the last one wins.
+        """
+        codes, ids = pd.factorize(panel[id_col], sort=False)
+        ds, position = np.unique(panel['ds'].to_numpy(dtype='datetime64[ns]'), return_inverse=True)
+        fields = {}
+        for column in value_cols:
+            values = np.full((len(ids), len(ds)), np.nan, dtype=dtype)
+            values[codes, position] = panel[column].to_numpy()
+            fields[column] = values
+        return cls(np.asarray(ids, dtype=object), ds, fields)
+
+    @classmethod
+    def from_wide(cls, wide, field='y', dtype=np.float32):
+        """Build a store from a date-indexed frame with one column per series."""
+        wide = wide.sort_index()
+        values = wide.to_numpy(dtype=dtype, na_value=np.nan).T.copy()
+        return cls(wide.columns.to_numpy(dtype=object), wide.index.to_numpy(), {field: values})
+
+    @classmethod
+    def from_forecasts(cls, results, columns=FORECAST_COLUMNS[1:], dtype=np.float32):
+        """Collect ``forecast_batch`` results (or ``(series_id, forecast)`` pairs) into a store.
+
+        Failed results (``forecast`` of ``None``) are skipped.
+        """
+        pairs = []
+        for result in results:
+            series_id, forecast = ((result['series_id'], result['forecast'])
+                                   if isinstance(result, dict) else result)
+            if forecast is not None:
+                pairs.append((series_id, forecast))
+        long = pd.concat(
+            [forecast[['ds', *columns]].assign(series_id=series_id) for series_id, forecast in pairs],
+            ignore_index=True,
+        ) if pairs else pd.DataFrame(columns=['series_id', 'ds', *columns])
+        return cls.from_long(long, 'series_id', columns, dtype)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for series_id in self.ids:
+            yield series_id, self.series(series_id)
+
+    @property
+    def nbytes(self):
+        return self.ds.nbytes + sum(values.nbytes for values in self.fields.values())
+
+    def series(self, series_id, dtype=np.float64):
+        """One series as a ``ds`` + fields frame, without its missing timestamps.
+
+        Values are cast to ``dtype`` (float64 by default, which is what
+        Prophet works in).
+        """
+        row = self._positions[series_id]
+        present = np.zeros(len(self.ds), dtype=bool)
+        for values in self.fields.values():
+            present |= ~np.isnan(values[row])
+        data = {'ds': self.ds[present]}
+        for name, values in self.fields.items():
+            data[name] = values[row, present].astype(dtype)
+        return pd.DataFrame(data)
+
+    def to_long(self, id_col='series_id'):
+        """The store as a long frame, dropping timestamps where every field is NaN."""
+        present = np.zeros((len(self.ids), len(self.ds)), dtype=bool)
+        for values in self.fields.values():
+            present |= ~np.isnan(values)
+        rows, cols = np.nonzero(present)
+        data = {id_col: self.ids[rows], 'ds': self.ds[cols]}
+        for name, values in self.fields.items():
+            data[name] = values[rows, cols]
+        return pd.DataFrame(data)
+
+
+def peak_memory(fn, *args, **kwargs):
+    """Run ``fn`` under ``tracemalloc``; returns ``(result, peak_bytes)``."""
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        result = fn(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+if __name__ == '__main__':
+    from benchmarks import BASE_ROWS, make_search_trends
+    from forecasting import to_long_format
+
+    n_series = 200
+    trends = make_search_trends(BASE_ROWS)
+    wide = pd.DataFrame({f'term_{i}': np.roll(trends['Search Trends'].to_numpy(), i).astype(np.float64)
+                         for i in range(n_series)}, index=trends.index)
+
+    def groups_long():
+        panel = to_long_format(wide)
+        return sum(len(group) for _, group in panel.groupby('series_id', sort=False))
+
+    def groups_compact():
+        store = SeriesStore.from_wide(wide)
+        return sum(len(df) for _, df in store)
+
+    rows_long, peak_long = peak_memory(groups_long)
+    rows_compact, peak_compact = peak_memory(groups_compact)
+    assert rows_long == rows_compact
+    print(f'{n_series} series x {len(wide)} hours: long panel peak {peak_long / 2**20:.0f} MiB, '
+          f'SeriesStore peak {peak_compact / 2**20:.0f} MiB')
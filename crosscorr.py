@@ -0,0 +1,143 @@
+"""Lag-scan cross-correlation between search traffic and stock returns/volatility.
+
+Step 3 of the notebook checks a single lag: the ``.corr()`` of ``Lagged
+Search Trends`` (shifted one hour) with ``Stock Volatility`` and ``Hourly
+Stock Return``. ``lag_scan`` computes that same correlation for every lag
+in one step. All the sums a Pearson correlation needs (counts, sums, sums
+of squares and cross products over the overlapping, non-missing rows) are
+computed for every lag at once as FFT cross-correlations, so the cost is
+O(n log n) instead of one shift-and-correlate per lag. The results match
+``source.shift(lag).corr(target)`` for each lag.
+
+Lags are in rows, like ``shift``; a positive lag means search traffic
+leads the target. ``rolling_lag_corr`` gives windowed correlations over
+time for a set of lags, using cumulative sums.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def _xcorr(a, b, size):
+    # c[k] = sum_t a[t - k] * b[t]; negative k wraps to the end of the array
+    return np.fft.irfft(np.conj(np.fft.rfft(a, size)) * np.fft.rfft(b, size), size)
+
+
+def _lag_sums(x, y):
+    """Per-lag overlap counts and sums for Pearson correlations of x shifted against y."""
+    mx = ~np.isnan(x)
+    my = ~np.isnan(y)
+    # Center on the overall means so the variance sums do not cancel badly
+    x0 = np.where(mx, x - x[mx].mean(), 0.0)
+    y0 = np.where(my, y - y[my].mean(), 0.0)
+    fx = mx.astype(np.float64)
+    fy = my.astype(np.float64)
+
+    size = 1 << int(np.ceil(np.log2(2 * len(x))))
+    return {
+        'n': np.rint(_xcorr(fx, fy, size)),
+        'sx': _xcorr(x0, fy, size),
+        'sy': _xcorr(fx, y0, size),
+        'sxx': _xcorr(x0 ** 2, fy, size),
+        'syy': _xcorr(fx, y0 ** 2, size),
+        'sxy': _xcorr(x0, y0, size),
+    }
+
+
+def _p_values(z):
+    return np.array([math.erfc(abs(v) / math.sqrt(2)) if np.isfinite(v) else np.nan for v in z])
+
+
+def lag_corr(source, target, lags):
+    """Pearson correlation of ``source`` shifted by each lag against ``target``.
+
+    Returns a frame indexed by lag with the correlation ``corr``, the
+    number of overlapping rows ``n``, the Fisher ``z`` statistic
+    (``atanh(corr) * sqrt(n - 3)``) and its two-sided normal ``p_value``.
+    The p-values assume independent rows; for autocorrelated series such
+    as volatility they are optimistic and are best used to rank lags.
+    """
+    x = np.asarray(source, dtype=np.float64)
+    y = np.asarray(target, dtype=np.float64)
+    lags = np.asarray(lags, dtype=np.int64)
+    if len(lags) and np.abs(lags).max() >= len(x):
+        raise ValueError('Lags must be shorter than the series')
+
+    sums = {name: values[lags % len(values)] for name, values in _lag_sums(x, y).items()}
+    n = sums['n']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sums['sxy'] - sums['sx'] * sums['sy'] / n
+        var_x = np.maximum(sums['sxx'] - sums['sx'] ** 2 / n, 0)
+        var_y = np.maximum(sums['syy'] - sums['sy'] ** 2 / n, 0)
+        corr = np.clip(cov / np.sqrt(var_x * var_y), -1, 1)
+        corr[n < 2] = np.nan
+        z = np.arctanh(corr) * np.sqrt(n - 3)
+
+    return pd.DataFrame({'corr': corr, 'n': n.astype(np.int64), 'z': z, 'p_value': _p_values(z)},
+                        index=pd.Index(lags, name='lag'))
+
+
+def lag_scan(df, source='Search Trends',
+             targets=('Hourly Stock Return', 'Stock Volatility'), max_lag=500, min_lag=0):
+    """Scan lags ``min_lag``..``max_lag`` of ``df[source]`` against each target column.
+
+    Returns a lag x (target, statistic) frame; see ``lag_corr`` for the
+    statistics.
+    """
+    lags = np.arange(min_lag, max_lag + 1)
+    results = {target: lag_corr(df[source].to_numpy(), df[target].to_numpy(), lags)
+               for target in targets}
+    return pd.concat(results, axis=1)
+
+
+def best_lags(scan, top=10):
+    """The ``top`` lags with the largest absolute correlation for each target."""
+    rows = []
+    for target in scan.columns.get_level_values(0).unique():
+        stats = scan[target].dropna(subset=['corr'])
+        ranked = stats.reindex(stats['corr'].abs().sort_values(ascending=False).index[:top])
+        rows.append(ranked.assign(target=target).reset_index())
+    return pd.concat(rows, ignore_index=True)[['target', 'lag', 'corr', 'n', 'z', 'p_value']]
+
+
+def rolling_lag_corr(source, target, lags, window):
+    """Rolling ``window``-row correlations of ``source`` shifted by each lag against ``target``.
+
+    Uses cumulative sums, so each lag costs O(n) regardless of the window.
+    Windows containing missing values are NaN. Returns a time x lag frame
+    indexed like ``target`` when it is a Series.
+    """
+    index = target.index if isinstance(target, pd.Series) else None
+    x = np.asarray(source, dtype=np.float64)
+    y = np.asarray(target, dtype=np.float64)
+    y = y - np.nanmean(y)
+
+    def window_sum(values):
+        csum = np.concatenate([[0.0], np.cumsum(values)])
+        out = np.full(len(values), np.nan)
+        out[window - 1:] = csum[window:] - csum[:-window]
+        return out
+
+    columns = {}
+    for lag in lags:
+        shifted = np.full(len(x), np.nan)
+        if lag >= 0:
+            shifted[lag:] = x[:len(x) - lag]
+        else:
+            shifted[:lag] = x[-lag:]
+        shifted = shifted - np.nanmean(shifted)
+        bad = np.isnan(shifted) | np.isnan(y)
+        a = np.where(bad, 0.0, shifted)
+        b = np.where(bad, 0.0, y)
+        has_gap = window_sum(bad.astype(np.float64)) > 0
+        sa, sb = window_sum(a), window_sum(b)
+        cov = window_sum(a * b) - sa * sb / window
+        var_a = window_sum(a * a) - sa ** 2 / window
+        var_b = window_sum(b * b) - sb ** 2 / window
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.sqrt(np.maximum(var_a, 0) * np.maximum(var_b, 0))
+        corr[has_gap] = np.nan
+        columns[lag] = corr
+    return pd.DataFrame(columns, index=index).rename_axis(columns='lag')
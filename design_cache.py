@@ -0,0 +1,283 @@
+"""Shared cache of Prophet's Fourier seasonality features.
+
+Every ``fit`` and ``predict`` rebuilds the daily, weekly and yearly
+Fourier terms (``2 * order`` sines and cosines per row) for every
+timestamp, although many models, folds and runs use the same hourly grid.
+``FourierCache`` stores each block as a ``.npy`` file, keyed by the grid's
+step, the seasonality period and the Fourier order, and covering a range
+of timestamps. A request for any aligned sub-range is served as a slice
+of the memory-mapped file, so a backtest fold (a prefix of the history)
+or a future frame that overlaps an earlier one reads existing rows.
+Worker processes pointed at the same directory share the files through
+the OS page cache instead of each computing its own copy.
+
+Blocks start and end on multiples of ``chunk`` grid steps, so a new
+block is padded ahead of the range that missed: a forecast origin that
+moves forward an hour at a time reads the padding instead of computing a
+new block per request. When a range runs past a block, the block is
+grown to cover both and rounded out to the next chunk.
+
+Several processes may read and grow blocks in the same directory at once.
+Blocks are written to a temporary file and renamed into place. A grown
+block supersedes the smaller ones it covers (lookups try the largest
+block first); they are deleted by a later miss once the block covering
+them is ``sweep_after`` seconds old, long after any process that listed
+them has opened its map (open maps stay valid after unlinking). If a
+block still disappears between listing and loading, the lookup lists the
+directory again, and if the cache cannot be read or written at all the
+features are computed in memory.
+
+Features are only cached for regular grids (a constant step between
+timestamps) without a time zone; anything else falls through to
+Prophet's own computation. Entries are computed with Prophet's own
+``fourier_series`` over the full range, so cached values are identical
+to uncached ones.
+
+``install(directory)`` routes ``Prophet.fourier_series`` through the
+cache for the whole process (as the backtest and batch workers do);
+``cached_fourier(directory)`` does the same for one ``with`` block.
+"""
+
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+_ENTRY = re.compile(r'^fourier_(\d+)_([0-9.e+-]+)_(\d+)_(-?\d+)_(\d+)\.npy$')
+
+# The active cache and Prophet's original function, while installed
+_installed = None
+_original = None
+_lock = threading.Lock()
+
+
+def _grid(dates):
+    # (start_ns, step_ns, n) for a regular tz-naive grid, else None
+    if len(dates) < 2 or getattr(dates.dt, 'tz', None) is not None:
+        return None
+    ns = dates.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    step = int(ns[1] - ns[0])
+    if step <= 0 or not (np.diff(ns) == step).all():
+        return None
+    return int(ns[0]), step, len(ns)
+
+
+class FourierCache:
+    """Memory-mapped Fourier feature blocks in ``directory``.
+
+    ``hits`` counts requests served from an existing block and ``misses``
+    those that computed (and stored) a new one. Blocks are aligned to
+    ``chunk`` grid steps, and superseded blocks are removed once the block
+    covering them is ``sweep_after`` seconds old.
+    """
+
+    def __init__(self, directory, chunk=4096, sweep_after=60.0):
+        self.directory = directory
+        self.chunk = chunk
+        self.sweep_after = sweep_after
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._maps = {}
+
+    def _path(self, step, period, order, start, n):
+        return os.path.join(self.directory, f'fourier_{step}_{float(period)!r}_{order}_{start}_{n}.npy')
+
+    def _entries(self, step, period, order):
+        # (start, n, path) of every stored block for this key, largest first
+        entries = []
+        for name in os.listdir(self.directory):
+            match = _ENTRY.match(name)
+            if (match and int(match[1]) == step and float(match[2]) == float(period)
+                    and int(match[3]) == order):
+                entries.append((int(match[4]), int(match[5]), os.path.join(self.directory, name)))
+        return sorted(entries, key=lambda entry: -entry[1])
+
+    def _load(self, path):
+        matrix = self._maps.get(path)
+        if matrix is None:
+            matrix = self._maps[path] = np.load(path, mmap_mode='r')
+        return matrix
+
+    def _compute(self, step, period, order, start, n, compute):
+        dates = pd.Series(pd.to_datetime(start + step * np.arange(n, dtype=np.int64)))
+        matrix = np.ascontiguousarray(compute(dates, period, order))
+        path = self._path(step, period, order, start, n)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+        try:
+            np.save(tmp, matrix)
+            os.replace(tmp, path)
+            return self._load(path)
+        except OSError:
+            # Unwritable directory, or the block was cleared straight away: use it unshared
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return matrix
+
+    def _lookup(self, start, step, n, period, order):
+        # A slice of the largest stored block covering the range, plus the listed entries
+        for _ in range(3):
+            entries = self._entries(step, period, order)
+            try:
+                for entry_start, entry_n, path in entries:
+                    offset, remainder = divmod(start - entry_start, step)
+                    if remainder == 0 and offset >= 0 and offset + n <= entry_n:
+                        return self._load(path)[offset:offset + n], entries
+                return None, entries
+            except FileNotFoundError:
+                # Removed by clear() in another process since the listing; list again
+                continue
+        return None, []
+
+    def _sweep(self, entries, step):
+        # Forget superseded blocks, and delete those whose successor has been visible long enough
+        now = time.time()
+        for i, (entry_start, entry_n, path) in enumerate(entries):
+            entry_end = entry_start + step * entry_n
+            for other_start, other_n, other in entries[:i]:
+                if ((entry_start - other_start) % step == 0 and other_start <= entry_start
+                        and entry_end <= other_start + step * other_n):
+                    self._maps.pop(path, None)
+                    try:
+                        if now - os.path.getmtime(other) >= self.sweep_after:
+                            os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    break
+
+    def fourier_series(self, dates, period, series_order, compute):
+        """Fourier features of ``dates``, read from or added to the cache.
+
+        ``compute`` is Prophet's own ``fourier_series``; it is used as is
+        for irregular dates and to fill new blocks.
+        """
+        grid = _grid(dates)
+        if grid is None:
+            return compute(dates, period, series_order)
+        start, step, n = grid
+        end = start + step * n
+
+        cached, entries = self._lookup(start, step, n, period, series_order)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        # Grow the largest aligned block that overlaps or touches this range, if any
+        for entry_start, entry_n, path in entries:
+            entry_end = entry_start + step * entry_n
+            if (start - entry_start) % step == 0 and start <= entry_end and entry_start <= end:
+                start, end = min(start, entry_start), max(end, entry_end)
+                break
+        # Round out to whole chunks of the absolute grid, which pads the block ahead of ``end``
+        extent = step * self.chunk
+        start -= (start // step % self.chunk) * step
+        end = start + -(-(end - start) // extent) * extent
+        self.misses += 1
+        total = (end - start) // step
+        matrix = self._compute(step, period, series_order, start, total, compute)
+        self._sweep(entries, step)
+        offset = (grid[0] - start) // step
+        return matrix[offset:offset + n]
+
+    def stats(self):
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if _ENTRY.match(name)]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(files),
+                'bytes': sum(os.path.getsize(path) for path in files)}
+
+    def clear(self):
+        """Remove every block; only call this when no other process is using the cache."""
+        self._maps.clear()
+        for name in os.listdir(self.directory):
+            if _ENTRY.match(name):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+def install(directory):
+    """Route ``Prophet.fourier_series`` through a ``FourierCache`` in ``directory``."""
+    global _installed, _original
+    from prophet import Prophet
+
+    with _lock:
+        if _original is None:
+            _original = Prophet.fourier_series
+        cache = _installed = FourierCache(directory)
+        original = _original
+
+        def fourier_series(dates, period, series_order):
+            return cache.fourier_series(dates, period, series_order, original)
+
+        Prophet.fourier_series = staticmethod(fourier_series)
+    return cache
+
+
+def uninstall():
+    """Restore Prophet's own ``fourier_series``."""
+    global _installed, _original
+    from prophet import Prophet
+
+    with _lock:
+        if _original is not None:
+            Prophet.fourier_series = staticmethod(_original)
+        _installed = _original = None
+
+
+def installed():
+    """The active ``FourierCache``, or ``None``."""
+    return _installed
+
+
+@contextmanager
+def cached_fourier(directory):
+    """Use a ``FourierCache`` in ``directory`` for the duration of the block."""
+    previous = _installed
+    cache = install(directory)
+    try:
+        yield cache
+    finally:
+        if previous is None:
+            uninstall()
+        else:
+            install(previous.directory)
+
+
+def _stress_worker(directory, seed, rounds):
+    # Random overlapping hourly ranges through a shared cache, checked against Prophet
+    from prophet import Prophet
+
+    rng = np.random.default_rng(seed)
+    # Small chunks and an immediate sweep, so blocks are grown and deleted under other readers
+    cache = FourierCache(directory, chunk=256, sweep_after=0)
+    base = pd.Timestamp('2020-01-01')
+    for _ in range(rounds):
+        # One key and short ranges, so every worker reads the same few blocks
+        dates = pd.Series(pd.date_range(base + pd.Timedelta(hours=int(rng.integers(0, 5000))),
+                                        periods=int(rng.integers(2, 200)), freq='h'))
+        got = cache.fourier_series(dates, 24, 4, Prophet.fourier_series)
+        np.testing.assert_array_equal(got, Prophet.fourier_series(dates, 24, 4))
+    return cache.hits, cache.misses
+
+
+if __name__ == '__main__':
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Regression check: workers growing and sweeping blocks in one directory must never fail
+    processes, rounds = 8, 200
+    with tempfile.TemporaryDirectory() as directory:
+        with ProcessPoolExecutor(processes) as pool:
+            counts = list(pool.map(_stress_worker, [directory] * processes, range(processes),
+                                   [rounds] * processes))
+        stats = FourierCache(directory).stats()
+    print(f'{processes} processes x {rounds} requests: {sum(h for h, _ in counts)} hits, '
+          f'{sum(m for _, m in counts)} misses, {stats["entries"]} blocks on disk')
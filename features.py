@@ -0,0 +1,134 @@
+"""One-pass rolling feature engine for the Step 3 stock/search features.
+
+Step 3 of the notebook built ``Lagged Search Trends``, ``Close Return``,
+``Stock Volatility`` and ``Hourly Stock Return`` one column at a time,
+calling ``pct_change()`` on ``close`` twice, and never computed the
+exponentially weighted volatility the instructions describe.
+``FeatureEngine`` takes the lags, return horizons, rolling windows and EWM
+spans up front and computes every feature from contiguous NumPy arrays,
+deriving the one-bar return once and reusing it for the rolling and EWM
+volatilities.
+
+The engine keeps the last few bars (and the EWM state) after each call,
+so ``update`` can extend the features as new bars arrive without
+recomputing the history. Features produced incrementally are identical to
+those computed over the full history.
+"""
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from instrumentation import stage
+
+
+# The notebook's column names for the default features
+NOTEBOOK_COLUMNS = {
+    'Lagged Search Trends 1': 'Lagged Search Trends',
+    'Stock Return 1': 'Hourly Stock Return',
+    'Stock Volatility 4': 'Stock Volatility',
+}
+
+
+def _lag(values, k):
+    out = np.full(len(values), np.nan)
+    if k < len(values):
+        out[k:] = values[:len(values) - k]
+    return out
+
+
+def _rolling_std(values, window):
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        # Windows that include a NaN come out as NaN, as with pandas' default min_periods
+        out[window - 1:] = sliding_window_view(values, window).std(axis=1, ddof=1)
+    return out
+
+
+def _ewm_mean(values, alpha, start=None):
+    # Recursive (adjust=False) EWM; ``start`` is the previous smoothed value, if any
+    if start is not None and not np.isnan(start):
+        series = pd.Series(np.concatenate([[start], values]))
+        return series.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+    return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+class FeatureEngine:
+    """Compute lag, return and volatility features for a stock/search frame.
+
+    ``lags`` shift ``search_column`` by that many bars. ``return_horizons``
+    are percent changes of ``price_column`` over that many bars.
+    ``rolling_windows`` are rolling standard deviations of the one-bar
+    return, and ``ewm_spans`` are exponentially weighted volatilities
+    (square root of the recursive EWM of the squared one-bar return).
+    """
+
+    def __init__(self, lags=(1,), return_horizons=(1,), rolling_windows=(4,), ewm_spans=(4,),
+                 search_column='Search Trends', price_column='close'):
+        self.lags = sorted(set(lags))
+        self.return_horizons = sorted(set(return_horizons))
+        self.rolling_windows = sorted(set(rolling_windows))
+        self.ewm_spans = sorted(set(ewm_spans))
+        self.search_column = search_column
+        self.price_column = price_column
+        # Bars of history needed to compute the features of the next bar
+        self.lookback = max([1] + self.lags + self.return_horizons
+                            + [w + 1 for w in self.rolling_windows])
+        self._tail = None
+        self._ewm_state = {}
+
+    def _compute(self, search, price, ewm_start=0, ewm_state=None):
+        # ``ewm_start`` skips bars whose EWM values are already known; the EWM
+        # for the rest continues from ``ewm_state``
+        ewm_state = ewm_state or {}
+        features = {}
+        for k in self.lags:
+            features[f'Lagged Search Trends {k}'] = _lag(search, k)
+
+        # The one-bar return is shared by the horizon-1 return and every volatility
+        returns = price / _lag(price, 1) - 1
+        for h in self.return_horizons:
+            features[f'Stock Return {h}'] = returns if h == 1 else price / _lag(price, h) - 1
+        for w in self.rolling_windows:
+            features[f'Stock Volatility {w}'] = _rolling_std(returns, w)
+
+        squared = returns[ewm_start:] ** 2
+        new_state = {}
+        for span in self.ewm_spans:
+            variance = _ewm_mean(squared, 2 / (span + 1), ewm_state.get(span))
+            features[f'Stock EWM Volatility {span}'] = np.concatenate(
+                [np.full(ewm_start, np.nan), np.sqrt(variance)])
+            new_state[span] = variance[-1] if len(variance) else ewm_state.get(span)
+        return features, new_state
+
+    def transform(self, df):
+        """Compute the features for the whole of ``df`` and reset the incremental state."""
+        with stage('feature_engineering', rows=len(df)):
+            search = df[self.search_column].to_numpy(dtype=np.float64)
+            price = df[self.price_column].to_numpy(dtype=np.float64)
+            features, self._ewm_state = self._compute(search, price)
+            self._tail = (search[-self.lookback:], price[-self.lookback:])
+            return pd.DataFrame(features, index=df.index)
+
+    def update(self, new_bars):
+        """Compute the features for bars appended since the last ``transform``/``update``."""
+        if self._tail is None:
+            return self.transform(new_bars)
+        old_search, old_price = self._tail
+        search = np.concatenate([old_search, new_bars[self.search_column].to_numpy(dtype=np.float64)])
+        price = np.concatenate([old_price, new_bars[self.price_column].to_numpy(dtype=np.float64)])
+
+        # Only the last ``lookback`` bars are kept, which covers every lag and window
+        n_old = len(old_price)
+        features, self._ewm_state = self._compute(search, price, n_old, self._ewm_state)
+        self._tail = (search[-self.lookback:], price[-self.lookback:])
+        return pd.DataFrame({name: values[n_old:] for name, values in features.items()},
+                            index=new_bars.index)
+
+
+def notebook_features(df, ewm_span=4):
+    """The notebook's Step 3 features (plus the EWM volatility), under its column names."""
+    engine = FeatureEngine(lags=[1], return_horizons=[1], rolling_windows=[4], ewm_spans=[ewm_span])
+    features = engine.transform(df)
+    return features.rename(columns={f'Stock EWM Volatility {ewm_span}': 'Stock EWM Volatility',
+                                    **NOTEBOOK_COLUMNS})
@@ -0,0 +1,140 @@
+"""Content-addressed on-disk cache for Prophet forecasts.
+
+Re-running the notebook re-fits the model and re-runs
+``make_future_dataframe``/``predict`` even when neither the data nor the
+settings changed. ``ForecastCache`` stores the ``yhat``/``yhat_lower``/
+``yhat_upper`` frame under a key that hashes the input series, the Prophet
+hyperparameters and the horizon, so an unchanged request is answered from
+disk. The cache is bounded by entry count and/or total bytes and evicts
+the least recently used entries first.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+CACHED_COLUMNS = ['yhat', 'yhat_lower', 'yhat_upper']
+
+
+def _content(value):
+    # Stand-in for settings json can't encode. Frames and arrays are hashed by content: their
+    # str() is truncated, so e.g. two ``holidays`` frames differing in a middle row would collide
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        hashed = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        labels = list(value.columns) if isinstance(value, pd.DataFrame) else [value.name]
+        return {'frame': hashlib.sha256(hashed.tobytes()).hexdigest(), 'columns': labels}
+    if isinstance(value, np.ndarray):
+        data = (pd.util.hash_pandas_object(pd.Series(value.ravel()), index=False).to_numpy()
+                if value.dtype == object else np.ascontiguousarray(value))
+        return {'array': hashlib.sha256(data.tobytes()).hexdigest(), 'dtype': value.dtype.str,
+                'shape': list(value.shape)}
+    return str(value)
+
+
+def forecast_key(df, periods, freq='h', prophet_kwargs=None):
+    """Hash a ``ds``/``y`` frame, the Prophet settings and the horizon into a cache key.
+
+    DataFrame and array settings (such as ``holidays``) are hashed by content.
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(df['ds'].to_numpy(dtype='datetime64[ns]').view(np.int64)))
+    digest.update(np.ascontiguousarray(df['y'].to_numpy(dtype=np.float64)))
+    config = {'periods': periods, 'freq': freq, 'prophet': prophet_kwargs or {}}
+    digest.update(json.dumps(config, sort_keys=True, default=_content).encode())
+    return digest.hexdigest()
+
+
+class ForecastCache:
+    """LRU cache of forecast frames stored as ``.npz`` files in ``directory``.
+
+    Recency is tracked through each file's modification time, which is
+    bumped on every hit, so the order survives across processes and runs.
+    ``hits``, ``misses`` and ``evictions`` count what this instance did.
+    """
+
+    def __init__(self, directory, max_entries=None, max_bytes=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        """Return the cached forecast for ``key``, or None on a miss."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                frame = pd.DataFrame({column: data[column] for column in CACHED_COLUMNS},
+                                     index=pd.DatetimeIndex(data['ds'], name='ds'))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return frame
+
+    def put(self, key, forecast):
+        """Store the forecast columns of ``forecast`` under ``key`` and enforce the limits.
+
+        ``forecast`` may have ``ds`` either as a column (as ``predict``
+        returns it) or as the index.
+        """
+        ds = forecast['ds'] if 'ds' in forecast.columns else forecast.index
+        arrays = {'ds': np.asarray(ds, dtype='datetime64[ns]')}
+        for column in CACHED_COLUMNS:
+            arrays[column] = forecast[column].to_numpy(dtype=np.float64)
+        # np.savez adds the .npz suffix itself, so the temporary name ends in .tmp.npz
+        tmp = self._path(key + '.tmp')
+        np.savez(tmp, **arrays)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache is within its limits."""
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries)
+                           or (self.max_bytes is not None and total > self.max_bytes)):
+            _, size, name = entries.pop(0)
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Hit/miss/eviction counters and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def forecast(self, df, periods=2000, freq='h', prophet_kwargs=None):
+        """Return the forecast for ``df``, fitting and predicting only on a miss."""
+        key = forecast_key(df, periods, freq, prophet_kwargs)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        from forecasting import fit_predict
+
+        _, forecast, _ = fit_predict(df, periods, freq, prophet_kwargs)
+        self.put(key, forecast)
+        return forecast.set_index('ds')[CACHED_COLUMNS]
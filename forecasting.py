@@ -0,0 +1,168 @@
+"""Fitting and predicting many Prophet series in parallel.
+
+Step 4 of the notebook fits one ``Prophet()`` on the search trends. For
+many search terms and tickers, ``forecast_batch`` takes a long-format
+frame (``series_id``, ``ds``, ``y``), fits and predicts each series in a
+``ProcessPoolExecutor`` and yields each result as soon as that series
+finishes. A series that fails is reported with its error instead of
+aborting the batch.
+
+Prophet is imported inside the worker functions because importing it
+also loads matplotlib, which costs about a second.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from instrumentation import stage
+
+
+FORECAST_COLUMNS = ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+
+
+def fit_predict(df, periods=2000, freq='h', prophet_kwargs=None):
+    """Fit Prophet on a ``ds``/``y`` frame and forecast ``periods`` steps ahead.
+
+    Returns ``(model, forecast, timings)``, where ``timings`` holds the
+    ``fit_s`` and ``predict_s`` wall times.
+    """
+    from prophet import Prophet
+
+    model = Prophet(**(prophet_kwargs or {}))
+
+    start = time.perf_counter()
+    with stage('prophet_fit', rows=len(df)):
+        model.fit(df)
+    fit_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with stage('make_future_dataframe', rows=periods):
+        future = model.make_future_dataframe(periods=periods, freq=freq)
+    with stage('predict', rows=len(future)):
+        forecast = model.predict(future)
+    predict_s = time.perf_counter() - start
+
+    return model, forecast, {'fit_s': fit_s, 'predict_s': predict_s}
+
+
+def quiet_stan_logs():
+    # Both libraries set their logger levels when first used, so do that first
+    import prophet  # noqa: F401
+    from cmdstanpy.utils import get_logger
+
+    get_logger().setLevel(logging.WARNING)
+    logging.getLogger('prophet').setLevel(logging.WARNING)
+
+
+def _forecast_one(series_id, df, periods, freq, prophet_kwargs, columns, compact=False,
+                  design_cache=None):
+    # Runs in a worker process; errors are returned rather than raised so one
+    # bad series cannot take down the batch
+    quiet_stan_logs()
+    if design_cache is not None:
+        from design_cache import install, installed
+
+        if installed() is None or installed().directory != design_cache:
+            install(design_cache)
+    try:
+        _, forecast, timings = fit_predict(df, periods, freq, prophet_kwargs)
+    except Exception as exc:
+        return {'series_id': series_id, 'forecast': None, 'error': f'{type(exc).__name__}: {exc}',
+                'fit_s': None, 'predict_s': None, 'rows': len(df)}
+    if compact:
+        from compact import compact_forecast
+
+        forecast = compact_forecast(forecast, FORECAST_COLUMNS if columns is None else columns)
+    elif columns is not None:
+        forecast = forecast[columns]
+    return {'series_id': series_id, 'forecast': forecast, 'error': None,
+            'fit_s': timings['fit_s'], 'predict_s': timings['predict_s'], 'rows': len(df)}
+
+
+def forecast_batch(panel, periods=2000, freq='h', max_workers=None, max_in_flight=None,
+                   prophet_kwargs=None, columns=FORECAST_COLUMNS, id_col='series_id',
+                   stats=None, compact=False, design_cache=None):
+    """Fit and predict every series in ``panel`` across a process pool.
+
+    ``panel`` is a long-format frame with ``id_col``, ``ds`` and ``y``
+    columns, or a ``compact.SeriesStore`` with a ``y`` field. Results are yielded as dicts (``series_id``, ``forecast``,
+    ``error``, ``fit_s``, ``predict_s``, ``rows``) in completion order. At
+    most ``max_in_flight`` series (default: twice the worker count) are
+    submitted at a time, so the pending inputs stay bounded. With
+    ``compact=True`` each forecast is projected onto ``columns`` and
+    downcast to float32 in the worker, before it is sent back. With a
+    ``design_cache`` directory, workers share Prophet's Fourier features
+    through a ``design_cache.FourierCache``, which pays off when the
+    series share a time grid.
+
+    If a ``stats`` dict is passed, it is filled in with ``series``,
+    ``failed``, ``wall_s`` and ``series_per_s`` once the batch finishes.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * max_workers
+    from compact import SeriesStore
+
+    groups = iter(panel) if isinstance(panel, SeriesStore) else iter(panel.groupby(id_col, sort=False))
+    done_count = failed = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = {}
+
+        def submit_next():
+            for series_id, group in groups:
+                df = group[['ds', 'y']].reset_index(drop=True)
+                future = pool.submit(_forecast_one, series_id, df, periods, freq,
+                                     prophet_kwargs, columns, compact, design_cache)
+                pending[future] = (series_id, len(df))
+                return True
+            return False
+
+        while len(pending) < max_in_flight and submit_next():
+            pass
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                series_id, rows = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    # The worker itself died (e.g. killed or out of memory)
+                    result = {'series_id': series_id, 'forecast': None,
+                              'error': f'{type(exc).__name__}: {exc}',
+                              'fit_s': None, 'predict_s': None, 'rows': rows}
+                done_count += 1
+                failed += result['error'] is not None
+                yield result
+                submit_next()
+
+    wall_s = time.perf_counter() - start
+    if stats is not None:
+        stats.update({
+            'series': done_count,
+            'failed': failed,
+            'wall_s': wall_s,
+            'series_per_s': done_count / wall_s if wall_s > 0 else float('inf'),
+        })
+
+
+def to_long_format(wide, id_name='series_id'):
+    """Turn a date-indexed frame with one column per series into ``series_id``/``ds``/``y`` rows."""
+    long = wide.rename_axis('ds').reset_index().melt(id_vars='ds', var_name=id_name, value_name='y')
+    return long.dropna(subset=['y'])[[id_name, 'ds', 'y']]
+
+
+if __name__ == '__main__':
+    from ingest import load_search_trends
+
+    trends = load_search_trends()
+    panel = to_long_format(trends[['Search Trends']])
+    stats = {}
+    for result in forecast_batch(panel, stats=stats):
+        status = result['error'] or f"fit {result['fit_s']:.2f}s, predict {result['predict_s']:.2f}s"
+        print(f"{result['series_id']}: {status}")
+    print(f"{stats['series']} series ({stats['failed']} failed) in {stats['wall_s']:.1f}s, "
+          f"{stats['series_per_s']:.2f} series/s")
@@ -0,0 +1,130 @@
+"""Warm-started Prophet refits for newly appended hours.
+
+Refitting Prophet from scratch on the full history is where most of the
+runtime goes, even when only the newest hours changed. ``refit`` instead
+passes the previous model's fitted parameters (``k``, ``m``, ``delta``,
+``beta``, ``sigma_obs``) to Stan as the starting point, so the optimizer
+starts near the answer. Models are persisted with Prophet's JSON
+serialization so the next run can pick up where this one left off.
+
+``benchmark_warm_start`` compares cold and warm fit times on the same data
+and reports how far the two forecasts drift apart.
+"""
+
+import os
+import time
+
+import numpy as np
+
+
+def save_model(model, path):
+    """Write a fitted model to ``path`` as Prophet JSON."""
+    from prophet.serialize import model_to_json
+
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(model_to_json(model))
+    os.replace(tmp, path)
+
+
+def load_model(path):
+    """Read a model written by ``save_model``."""
+    from prophet.serialize import model_from_json
+
+    with open(path) as f:
+        return model_from_json(f.read())
+
+
+def warm_start_params(model):
+    """Return the fitted parameters of ``model`` in the form Stan takes as ``init``."""
+    params = {}
+    for name in ['k', 'm', 'sigma_obs']:
+        params[name] = float(model.params[name][0][0])
+    for name in ['delta', 'beta']:
+        params[name] = np.asarray(model.params[name][0])
+    return params
+
+
+def is_append(model, df):
+    """True when ``df`` is the model's history with only newer rows appended."""
+    old = model.history['ds'].to_numpy()
+    new = df['ds'].to_numpy()
+    return len(new) >= len(old) and np.array_equal(new[:len(old)], old)
+
+
+def refit(model, df):
+    """Fit a copy of ``model`` on ``df``, warm-started from ``model``'s parameters.
+
+    The copy keeps the previous model's settings, seasonalities and
+    number of changepoints, so the parameter shapes line up. If ``df`` is
+    not the old history plus newly appended rows, the fit starts cold.
+    """
+    from prophet.diagnostics import prophet_copy
+
+    new_model = prophet_copy(model)
+    if is_append(model, df):
+        new_model.fit(df, init=warm_start_params(model))
+    else:
+        new_model.fit(df)
+    return new_model
+
+
+def refit_from_file(path, df, prophet_kwargs=None):
+    """Warm-start from the model saved at ``path`` (if any), refit on ``df`` and save it back."""
+    if os.path.exists(path):
+        model = refit(load_model(path), df)
+    else:
+        from prophet import Prophet
+
+        model = Prophet(**(prophet_kwargs or {}))
+        model.fit(df)
+    save_model(model, path)
+    return model
+
+
+def benchmark_warm_start(df, new_rows=24 * 7, periods=2000, freq='h', prophet_kwargs=None):
+    """Compare a cold fit with a warm-started refit after ``new_rows`` hours arrive.
+
+    A model is first fitted on ``df`` minus its last ``new_rows`` rows.
+    Then the full ``df`` is fitted both from scratch and warm-started from
+    that model, and both forecast ``periods`` steps ahead. Returns the
+    two fit times, the speedup, and the mean and max absolute difference
+    between the two ``yhat`` series (also relative to the mean of ``y``).
+    """
+    from prophet import Prophet
+
+    previous = Prophet(**(prophet_kwargs or {}))
+    previous.fit(df.iloc[:-new_rows])
+
+    start = time.perf_counter()
+    cold = Prophet(**(prophet_kwargs or {}))
+    cold.fit(df)
+    cold_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm = refit(previous, df)
+    warm_s = time.perf_counter() - start
+
+    future = cold.make_future_dataframe(periods=periods, freq=freq)
+    drift = np.abs(cold.predict(future)['yhat'].to_numpy() - warm.predict(future)['yhat'].to_numpy())
+    scale = float(np.abs(df['y']).mean()) or 1.0
+
+    return {
+        'cold_fit_s': cold_s,
+        'warm_fit_s': warm_s,
+        'speedup': cold_s / warm_s if warm_s > 0 else float('inf'),
+        'mean_abs_drift': float(drift.mean()),
+        'max_abs_drift': float(drift.max()),
+        'mean_rel_drift': float(drift.mean()) / scale,
+        'max_rel_drift': float(drift.max()) / scale,
+    }
+
+
+if __name__ == '__main__':
+    from ingest import load_search_trends
+
+    prophet_df = load_search_trends().reset_index().rename(columns={'Date': 'ds', 'Search Trends': 'y'})
+    result = benchmark_warm_start(prophet_df)
+    print(f"cold fit {result['cold_fit_s']:.2f}s, warm fit {result['warm_fit_s']:.2f}s "
+          f"({result['speedup']:.1f}x); yhat drift mean {result['mean_abs_drift']:.4f}, "
+          f"max {result['max_abs_drift']:.4f} ({result['max_rel_drift']:.2%} of mean y)")
@@ -0,0 +1,180 @@
+"""Local, cached loading of the search trends and stock price CSVs.
+
+The notebook used to download both CSVs over HTTP and re-parse every
+timestamp on every run. This module reads them from a local directory
+instead and keeps a parsed copy next to them, keyed by the checksum of
+the source file, so later runs skip the text parsing entirely.
+
+The cache is written as Parquet when pyarrow is installed, and otherwise
+as a directory of memory-mapped ``.npy`` files (a datetime64 index plus
+one numeric array per column).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+# Where the CSVs live, and where the parsed copies are kept
+DATA_DIR = os.environ.get("NET_PROPHET_DATA_DIR", ".")
+CACHE_DIR = os.environ.get("NET_PROPHET_CACHE_DIR", os.path.join(DATA_DIR, ".cache"))
+
+SEARCH_TRENDS_FILE = "google_hourly_search_trends.csv"
+STOCK_PRICE_FILE = "mercado_stock_price.csv"
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of the file at ``path``."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _default_format():
+    return "parquet" if HAS_PYARROW else "npy"
+
+
+def _cache_path(path, checksum, cache_dir, fmt):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    name = f"{stem}-{checksum[:16]}"
+    if fmt == "parquet":
+        return os.path.join(cache_dir, name + ".parquet")
+    return os.path.join(cache_dir, name + ".npy.d")
+
+
+def _write_npy(df, target):
+    # Write into a temporary directory first so a half-written cache is never read
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "index.npy"), df.index.values.astype("datetime64[ns]"))
+    for i, column in enumerate(df.columns):
+        np.save(os.path.join(tmp, f"col{i}.npy"), df[column].to_numpy())
+    meta = {"index_name": df.index.name, "columns": list(df.columns)}
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+
+
+def _read_npy(target):
+    with open(os.path.join(target, "meta.json")) as f:
+        meta = json.load(f)
+    # Copy-on-write maps stay lazy but give a writable frame, like read_csv and the Parquet path
+    index = np.load(os.path.join(target, "index.npy"), mmap_mode="c")
+    data = {
+        column: np.load(os.path.join(target, f"col{i}.npy"), mmap_mode="c")
+        for i, column in enumerate(meta["columns"])
+    }
+    return pd.DataFrame(data, index=pd.DatetimeIndex(index, name=meta["index_name"]), copy=False)
+
+
+def _write_parquet(df, target):
+    tmp = target + ".tmp"
+    df.to_parquet(tmp)
+    os.replace(tmp, target)
+
+
+def load_csv_cached(path, index_col, cache_dir=None, fmt=None):
+    """Load a date-indexed CSV, using the parsed cache when it is current.
+
+    The first load parses the CSV the same way the notebook did
+    (``index_col`` parsed as dates, rows with missing values dropped) and
+    writes the result to ``cache_dir``. Later loads of an unchanged file
+    read the cached copy instead.
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    fmt = _default_format() if fmt is None else fmt
+    if fmt not in ("parquet", "npy"):
+        raise ValueError(f"Unknown cache format: {fmt!r}")
+
+    with stage("data_load") as record:
+        target = _cache_path(path, file_checksum(path), cache_dir, fmt)
+        if os.path.exists(target):
+            df = pd.read_parquet(target) if fmt == "parquet" else _read_npy(target)
+            record["rows"] = len(df)
+            return df
+
+        df = pd.read_csv(path, index_col=index_col, parse_dates=True).dropna()
+        os.makedirs(cache_dir, exist_ok=True)
+        if fmt == "parquet":
+            _write_parquet(df, target)
+        else:
+            _write_npy(df, target)
+        record["rows"] = len(df)
+        return df
+
+
+def load_search_trends(path=None, cache_dir=None, fmt=None):
+    """Load the hourly Google search trends, indexed by ``Date``."""
+    path = os.path.join(DATA_DIR, SEARCH_TRENDS_FILE) if path is None else path
+    return load_csv_cached(path, "Date", cache_dir=cache_dir, fmt=fmt)
+
+
+def load_stock_prices(path=None, cache_dir=None, fmt=None):
+    """Load the hourly MercadoLibre closing prices, indexed by ``date``."""
+    path = os.path.join(DATA_DIR, STOCK_PRICE_FILE) if path is None else path
+    return load_csv_cached(path, "date", cache_dir=cache_dir, fmt=fmt)
+
+
+def clear_cache(path, cache_dir=None):
+    """Remove every cached copy of ``path`` from ``cache_dir``."""
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    if not os.path.isdir(cache_dir):
+        return
+    stem = os.path.splitext(os.path.basename(path))[0] + "-"
+    for name in os.listdir(cache_dir):
+        if name.startswith(stem):
+            full = os.path.join(cache_dir, name)
+            if os.path.isdir(full):
+                shutil.rmtree(full)
+            else:
+                os.remove(full)
+
+
+def time_load(path, index_col, cache_dir=None, fmt=None):
+    """Time a cold (CSV parse) load against a warm (cached) load of ``path``.
+
+    Returns a dict with ``cold_s``, ``warm_s``, ``speedup`` and ``rows``.
+    """
+    clear_cache(path, cache_dir)
+
+    start = time.perf_counter()
+    df = load_csv_cached(path, index_col, cache_dir=cache_dir, fmt=fmt)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_csv_cached(path, index_col, cache_dir=cache_dir, fmt=fmt)
+    warm = time.perf_counter() - start
+
+    return {
+        "path": path,
+        "rows": len(df),
+        "cold_s": cold,
+        "warm_s": warm,
+        "speedup": cold / warm if warm > 0 else float("inf"),
+    }
+
+
+if __name__ == "__main__":
+    for filename, index_col in [(SEARCH_TRENDS_FILE, "Date"), (STOCK_PRICE_FILE, "date")]:
+        stats = time_load(os.path.join(DATA_DIR, filename), index_col)
+        print(
+            f"{filename}: {stats['rows']} rows, cold {stats['cold_s']:.3f}s, "
+            f"warm {stats['warm_s']:.3f}s ({stats['speedup']:.1f}x)"
+        )
@@ -0,0 +1,190 @@
+"""Lightweight per-stage timing and memory instrumentation.
+
+Wrap a hot-path stage in ``with stage('fit', rows=len(df)):`` to record
+its wall time, CPU time (including child processes such as Stan), the
+process's peak RSS afterwards and, optionally, the ``tracemalloc``
+allocation delta and peak. Each record is appended to a JSON-lines log if
+one is configured, and per-stage totals can be written as a Prometheus
+text file.
+
+Instrumentation is off unless ``configure(enabled=True)`` is called or
+``NET_PROPHET_INSTRUMENT=1`` is set. While off, ``stage`` returns a
+shared no-op context manager, so the cost is one function call and an
+attribute check. Memory tracing (``trace_memory=True`` or
+``NET_PROPHET_TRACE_MEMORY=1``) is much more expensive and is off by
+default; when stages are nested, the inner stage resets the peak the
+outer one sees.
+"""
+
+import json
+import os
+import platform
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class _Config:
+    enabled = os.environ.get('NET_PROPHET_INSTRUMENT', '') not in ('', '0')
+    trace_memory = os.environ.get('NET_PROPHET_TRACE_MEMORY', '') not in ('', '0')
+    log_path = os.environ.get('NET_PROPHET_INSTRUMENT_LOG')
+
+
+_config = _Config()
+_lock = threading.Lock()
+_records = []
+_totals = {}
+
+
+class _NoopStage:
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+def configure(enabled=None, trace_memory=None, log_path=None):
+    """Turn instrumentation on or off and choose memory tracing and the log file."""
+    if enabled is not None:
+        _config.enabled = enabled
+    if trace_memory is not None:
+        _config.trace_memory = trace_memory
+    if log_path is not None:
+        _config.log_path = log_path
+    if _config.enabled and _config.trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def enabled():
+    return _config.enabled
+
+
+def cpu_seconds():
+    """CPU time of this process and its waited-for children (Stan runs in a child process)."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far."""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == 'Darwin' else peak * 1024
+
+
+@contextmanager
+def _recorded_stage(name, rows):
+    record = {'stage': name, 'rows': rows}
+    tracing = _config.trace_memory and tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        traced_start, _ = tracemalloc.get_traced_memory()
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['wall_s'] = time.perf_counter() - start
+        record['cpu_s'] = cpu_seconds() - cpu_start
+        record['peak_rss_bytes'] = peak_rss_bytes()
+        if tracing:
+            traced_end, traced_peak = tracemalloc.get_traced_memory()
+            record['traced_delta_bytes'] = traced_end - traced_start
+            record['traced_peak_bytes'] = traced_peak - traced_start
+        record['time'] = time.time()
+        _store(record)
+
+
+def stage(name, rows=None):
+    """Context manager that records one run of stage ``name``.
+
+    The yielded dict is the record being built; set ``record['rows']``
+    inside the block if the row count is only known there.
+    """
+    if not _config.enabled:
+        return _NOOP
+    return _recorded_stage(name, rows)
+
+
+def instrumented(name):
+    """Decorator form of ``stage`` for a whole function."""
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorator
+
+
+def _store(record):
+    with _lock:
+        _records.append(record)
+        totals = _totals.setdefault(record['stage'], {
+            'runs': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows': 0, 'peak_rss_bytes': 0, 'traced_peak_bytes': 0})
+        totals['runs'] += 1
+        totals['wall_s'] += record['wall_s']
+        totals['cpu_s'] += record['cpu_s']
+        totals['rows'] += record['rows'] or 0
+        totals['peak_rss_bytes'] = max(totals['peak_rss_bytes'], record['peak_rss_bytes'])
+        totals['traced_peak_bytes'] = max(totals['traced_peak_bytes'], record.get('traced_peak_bytes', 0))
+        if _config.log_path:
+            with open(_config.log_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+
+def records():
+    """Every record so far, oldest first."""
+    with _lock:
+        return list(_records)
+
+
+def totals():
+    """Per-stage totals: runs, wall/CPU seconds, rows, and the largest peak RSS and traced peak."""
+    with _lock:
+        return {name: dict(values) for name, values in _totals.items()}
+
+
+def reset():
+    with _lock:
+        _records.clear()
+        _totals.clear()
+
+
+_PROMETHEUS_METRICS = [
+    ('runs', 'net_prophet_stage_runs_total', 'counter', 'Number of times the stage ran.'),
+    ('wall_s', 'net_prophet_stage_wall_seconds_total', 'counter', 'Wall-clock seconds spent in the stage.'),
+    ('cpu_s', 'net_prophet_stage_cpu_seconds_total', 'counter',
+     'CPU seconds spent in the stage, including child processes.'),
+    ('rows', 'net_prophet_stage_rows_total', 'counter', 'Rows processed by the stage.'),
+    ('peak_rss_bytes', 'net_prophet_stage_peak_rss_bytes', 'gauge', 'Process peak RSS after the stage.'),
+    ('traced_peak_bytes', 'net_prophet_stage_traced_peak_bytes', 'gauge',
+     'Largest tracemalloc peak within the stage (0 unless memory tracing is on).'),
+]
+
+
+def prometheus_text():
+    """Per-stage totals in the Prometheus text exposition format."""
+    stage_totals = totals()
+    lines = []
+    for key, metric, kind, help_text in _PROMETHEUS_METRICS:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, values in sorted(stage_totals.items()):
+            lines.append(f'{metric}{{stage="{name}"}} {values[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Write ``prometheus_text()`` atomically to ``path`` (e.g. for a node_exporter textfile collector)."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
@@ -25,15 +25,21 @@ The following subsections detail these steps.
 ## Install and import the required libraries and dependencies
 """
 
+# Commented out IPython magic to ensure Python compatibility.
 # Install the required libraries
-!pip install prophet
+# !pip install prophet
 
-# Commented out IPython magic to ensure Python compatibility.
 # Import the required libraries and dependencies
 import pandas as pd
 from prophet import Prophet
 import datetime as dt
 import numpy as np
+import matplotlib.pyplot as plt
+from ingest import load_search_trends, load_stock_prices
+from seasonality import seasonality_profiles
+from features import notebook_features
+from crosscorr import best_lags, lag_scan
+from align import align_asof
 # %matplotlib inline
 
 """## Step 1: Find Unusual Patterns in Hourly Google Search Traffic
@@ -51,12 +57,10 @@ To do so, complete the following steps:
 
 # Store the data in a Pandas DataFrame
 # Set the "Date" column as the Datetime Index.
+# The CSV is read from NET_PROPHET_DATA_DIR and the parsed result is cached,
+# so later runs do not re-parse the timestamps.
 
-df_mercado_trends = pd.read_csv(
-    "https://static.bc-edx.com/ai/ail-v-1-0/m8/lms/datasets/google_hourly_search_trends.csv",
-    index_col='Date',
-    parse_dates=True
-).dropna()
+df_mercado_trends = load_search_trends()
 
 # Review the first and last five rows of the DataFrame
 display(df_mercado_trends.head())
@@ -69,7 +73,6 @@ df_mercado_trends.info()
 may_2020_data = df_mercado_trends.loc['2020-05-01':'2020-05-31']
 
 # Plot to visualize the data for May 2020
-import matplotlib.pyplot as plt
 plt.figure(figsize=(12, 6))
 may_2020_data['Search Trends'].plot(title="Google Search Trends for May 2020")
 plt.xlabel("Date")
@@ -79,7 +82,6 @@ plt.show()
 """#### Step 2: Calculate the total search traffic for the month, and then compare the value to the monthly median across all months. Did the Google search traffic increase during the month that MercadoLibre released its financial results?"""
 
 # Calculate the sum of the total search traffic for May 2020
-may_2020_data = df_mercado_trends.loc['2020-05-01':'2020-05-31']
 traffic_may_2020 = may_2020_data['Search Trends'].sum()
 
 
@@ -87,7 +89,11 @@ traffic_may_2020 = may_2020_data['Search Trends'].sum()
 print(f"Total search traffic for May 2020: {traffic_may_2020}")
 
 # Calcluate the monhtly median search traffic across all months
-monthly_traffic = df_mercado_trends.resample('M')['Search Trends'].sum()
+# Every seasonality profile (hour x day of week, day of week, ISO week, month, monthly totals) is
+# computed in one pass; the calendar keys are derived from the index once, and no helper columns
+# are added to df_mercado_trends. Part 2 reuses the same profiles.
+seasonality = seasonality_profiles(df_mercado_trends)
+monthly_traffic = seasonality['monthly_traffic']
 
 # Group the DataFrame by index year and then index month, chain the sum and then the median functions
 median_monthly_traffic = monthly_traffic.median()
@@ -99,15 +105,7 @@ print(f"The median monthly search traffic across all months is: {median_monthly_
 # Compare the seach traffic for the month of May 2020 to the overall monthly median value
 traffic_may_2020/median_monthly_traffic
 
-# Total search traffic for May 2020
-may_2020_data = df_mercado_trends.loc['2020-05-01':'2020-05-31']
-traffic_may_2020 = may_2020_data['Search Trends'].sum()
-
-# Overall monthly median value
-monthly_traffic = df_mercado_trends.resample('M')['Search Trends'].sum()
-median_monthly_traffic = monthly_traffic.median()
-
-
+# Compare the May 2020 total computed above with the overall monthly median value
 if traffic_may_2020 > median_monthly_traffic:
     comparison = "higher"
 elif traffic_may_2020 < median_monthly_traffic:
@@ -144,13 +142,9 @@ To that end, you want to mine the search traffic data for predictable seasonal p
 #### Step 1: Group the hourly search data to plot the average traffic by the hour of the day.
 """
 
-# Group the hourly search data to plot the average traffic by the day of week, using `df.index.hour`
-# Add 'DayOfWeek' and 'Hour' columns
-df_mercado_trends['DayOfWeek'] = df_mercado_trends.index.dayofweek
-df_mercado_trends['Hour'] = df_mercado_trends.index.hour
-
-# Group by 'DayOfWeek' and 'Hour' and calculate the mean
-hourly_avg_by_day = df_mercado_trends.groupby(['DayOfWeek', 'Hour'])['Search Trends'].mean().unstack(level=0)
+# The seasonality profiles were computed in one pass in Part 1, Step 2
+# Average traffic by hour of the day, one column per day of the week
+hourly_avg_by_day = seasonality['hourly_avg_by_day']
 
 # Plot the results
 plt.figure(figsize=(12, 6))
@@ -164,20 +158,10 @@ plt.show()
 
 """#### Step 2: Group the hourly search data to plot the average traffic by the day of the week (for example, Monday vs. Friday)."""
 
-# Extract the ISO calendar day of the week (1 = Monday, 7 = Sunday)
-df_mercado_trends['ISO_DayOfWeek'] = df_mercado_trends.index.isocalendar().day
-
-# Group the data by day of the week and calculate the average traffic
-average_traffic_by_isoday = df_mercado_trends.groupby('ISO_DayOfWeek')['Search Trends'].mean()
-
-# Map ISO day numbers to day names for better readability
-iso_day_mapping = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday',
-                   5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
-average_traffic_by_isoday.index = average_traffic_by_isoday.index.map(iso_day_mapping)
+# Average traffic by ISO day of the week (1 = Monday, 7 = Sunday), already mapped to day names
+average_traffic_by_isoday = seasonality['average_traffic_by_isoday']
 
 # Plot the average traffic by day of the week
-import matplotlib.pyplot as plt
-
 plt.figure(figsize=(10, 6))
 average_traffic_by_isoday.plot(kind='line', marker='o', color='skyblue')
 plt.title("Average Search Traffic by Day of Week")
@@ -189,15 +173,10 @@ plt.show()
 
 """#### Step 3: Group the hourly search data to plot the average traffic by the week of the year."""
 
-# Extract the ISO week number (1 to 52/53) from the index
-df_mercado_trends['ISO_Week'] = df_mercado_trends.index.isocalendar().week
-
-# Group the data by the week of the year and calculate the average traffic
-average_traffic_by_week = df_mercado_trends.groupby('ISO_Week')['Search Trends'].mean()
+# Average traffic by ISO week number (1 to 52/53)
+average_traffic_by_week = seasonality['average_traffic_by_week']
 
 # Plot the average traffic by week of the year
-import matplotlib.pyplot as plt
-
 plt.figure(figsize=(12, 6))
 average_traffic_by_week.plot(kind='line', marker='o', color='skyblue')
 plt.title("Average Search Traffic by Week of the Year")
@@ -233,13 +212,9 @@ To do so, complete the following steps:
 #### Step 1: Read in and plot the stock price data. Concatenate the stock price data to the search data in a single DataFrame.
 """
 
-# Upload the "mercado_stock_price.csv" file into Colab, then store in a Pandas DataFrame
+# Read "mercado_stock_price.csv" from the local data directory, then store in a Pandas DataFrame
 # Set the "date" column as the Datetime Index.
-df_mercado_stock = pd.read_csv(
-    "https://static.bc-edx.com/ai/ail-v-1-0/m8/lms/datasets/mercado_stock_price.csv",
-    index_col="date",
-    parse_dates=True
-).dropna()
+df_mercado_stock = load_stock_prices()
 
 # View the first and last five rows of the DataFrame
 display(df_mercado_stock.head())
@@ -254,13 +229,15 @@ plt.xticks(rotation=45)  # Rotate x-axis labels for better readability
 plt.grid(True)  # Add grid lines for clarity
 plt.show()
 
-# Concatenate the df_mercado_stock DataFrame with the df_mercado_trends DataFrame
-# Concatenate the DataFrame by columns (axis=1), and drop and rows with only one column of data
+# Combine the df_mercado_stock DataFrame with the df_mercado_trends DataFrame
+# Each stock bar is matched to the nearest search trends hour within 30 minutes,
+# and bars without a match (or with missing data) are dropped
 
-df_combined = pd.concat([df_mercado_stock, df_mercado_trends], axis=1)
+alignment_stats = {}
+df_combined = align_asof(df_mercado_stock, df_mercado_trends, tolerance='30min', stats=alignment_stats)
 
-# Drop rows with data in only one column (rows where all but one column is NaN)
-df_combined = df_combined.dropna(how='any')
+# Review how many rows were matched and dropped
+print(alignment_stats)
 
 # View the first and last five rows of the combined DataFrame
 display(df_combined.head())
@@ -301,10 +278,14 @@ plt.show()
 * “Hourly Stock Return”, which holds the percent change of the company's stock price on an hourly basis
 """
 
+# Compute the lagged search trends, hourly return and volatility features in one pass.
+# The hourly return is computed once and reused for both volatility measures.
+step3_features = notebook_features(df_combined)
+
 # Create a new column in the mercado_stock_trends_df DataFrame called Lagged Search Trends
 # This column should shift the Search Trends information by one hour
 
-df_combined['Lagged Search Trends'] = df_combined['Search Trends'].shift(1)
+df_combined['Lagged Search Trends'] = step3_features['Lagged Search Trends']
 
 # View the first few rows to confirm
 display(df_combined.head())
@@ -312,11 +293,11 @@ display(df_combined.head())
 # Create a new column in the mercado_stock_trends_df DataFrame called Stock Volatility
 # This column should calculate the standard deviation of the closing stock price return data over a 4 period rolling window
 
-# Calculate the percentage return of the closing stock price
-df_combined['Close Return'] = df_combined['close'].pct_change()
+# The rolling standard deviation (volatility) of the hourly return over a 4-period window
+df_combined['Stock Volatility'] = step3_features['Stock Volatility']
 
-# Calculate the rolling standard deviation (volatility) over a 4-period window
-df_combined['Stock Volatility'] = df_combined['Close Return'].rolling(window=4).std()
+# The exponentially weighted volatility (4-hour span) described in the instructions
+df_combined['Stock EWM Volatility'] = step3_features['Stock EWM Volatility']
 
 # View the first few rows to confirm
 display(df_combined.head())
@@ -335,21 +316,12 @@ plt.show()
 # Create a new column in the mercado_stock_trends_df DataFrame called Hourly Stock Return
 # This column should calculate hourly return percentage of the closing price
 
-# Calculate the hourly return percentage of the closing price
-df_combined['Hourly Stock Return'] = df_combined['close'].pct_change()
-
-# View the first few rows to confirm
-display(df_combined.head())
+# The hourly return percentage of the closing price
+df_combined['Hourly Stock Return'] = step3_features['Hourly Stock Return']
 
 # Rename the DataFrame
 mercado_stock_trends_df = df_combined
 
-# Calculate the hourly return percentage of the closing price
-mercado_stock_trends_df['Hourly Stock Return'] = mercado_stock_trends_df['close'].pct_change()
-
-# View the first few rows to confirm
-display(mercado_stock_trends_df.head())
-
 # View the first and last five rows of the mercado_stock_trends_df DataFrame
 display(mercado_stock_trends_df.head())
 
@@ -358,6 +330,12 @@ display(mercado_stock_trends_df.head())
 # Construct correlation table of Stock Volatility, Lagged Search Trends, and Hourly Stock Return
 mercado_stock_trends_df[['Stock Volatility', 'Lagged Search Trends', 'Hourly Stock Return']].corr()
 
+# Scan every lag up to one week (168 hours) at once, rather than only the one-hour lag above
+lag_correlations = lag_scan(mercado_stock_trends_df, max_lag=168)
+
+# Show the lags with the strongest correlation for each target, with their significance
+display(best_lags(lag_correlations, top=5))
+
 """##### Answer the following question:
 
 **Question:** Does a predictable relationship exist between the lagged search traffic and the stock volatility or between the lagged search traffic and the stock price returns?
@@ -411,7 +389,7 @@ prophet_model.fit(prophet_df)
 # Create a future dataframe to hold predictions
 # Make the prediction go out as far as 2000 hours (approx 80 days)
 # Create a future DataFrame for 2000 hours into the future
-future_mercado_trends = prophet_model.make_future_dataframe(periods=2000, freq='H')
+future_mercado_trends = prophet_model.make_future_dataframe(periods=2000, freq='h')
 
 # View the last five rows of the future DataFrame
 display(future_mercado_trends.tail())
@@ -0,0 +1,197 @@
+"""Headless batch pipeline for the Net Prophet analysis.
+
+``net_prophet.py`` is an exported notebook: it displays frames and shows
+plots as it goes. This module runs the same analysis end to end without a
+display -- ingest, seasonality, anomalies, features, forecast -- and writes
+structured outputs (Parquet when pyarrow is installed, JSON otherwise)
+plus a ``summary.json`` with the per-stage wall times. ``--compact``
+writes the feature and forecast frames with float32 / small-integer
+columns (see ``compact``).
+
+Prophet and matplotlib are imported only by the stages that need them, so
+``--skip-forecast`` runs and runs without ``--plot`` never load them.
+
+Usage::
+
+    python pipeline.py --data-dir data --output-dir out [--plot] [--skip-forecast]
+"""
+
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+import ingest
+import instrumentation
+from align import align_asof
+from anomalies import detect_anomalies
+from compact import compact_forecast, downcast_frame
+from crosscorr import best_lags, lag_scan
+from features import notebook_features
+from intervals import INTERVAL_MODES, predict_with_intervals
+from seasonality import seasonality_profiles
+
+
+@contextmanager
+def _stage(name, timings):
+    start = time.perf_counter()
+    try:
+        with instrumentation.stage(f'pipeline_{name}'):
+            yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def _write_frame(df, output_dir, name):
+    if ingest.HAS_PYARROW:
+        path = os.path.join(output_dir, name + '.parquet')
+        df.to_parquet(path)
+    else:
+        path = os.path.join(output_dir, name + '.json')
+        df.to_json(path, orient='table', date_format='iso')
+    return path
+
+
+def _series_to_json(obj):
+    # Profiles are Series/DataFrames with integer, string or date keys
+    if isinstance(obj, pd.DataFrame):
+        return {str(column): _series_to_json(obj[column]) for column in obj.columns}
+    return {str(key): (None if pd.isna(value) else float(value)) for key, value in obj.items()}
+
+
+def month_summary(monthly_traffic, month='2020-05'):
+    """Step 1: one month's total search traffic against the monthly median."""
+    traffic = float(monthly_traffic.loc[month].sum())
+    median = float(monthly_traffic.median())
+    return {
+        'month': month,
+        'traffic': traffic,
+        'median_monthly_traffic': median,
+        'ratio_to_median': traffic / median if median else None,
+    }
+
+
+def run_pipeline(data_dir=None, output_dir='output', periods=2000, freq='h',
+                 interval_mode='analytic', month='2020-05', max_lag=168,
+                 skip_forecast=False, plot=False, compact=False):
+    """Run every stage and write the outputs to ``output_dir``.
+
+    Returns the summary dict that is also written to ``summary.json``.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    timings = {}
+    outputs = {}
+    summary = {'timings_s': timings, 'outputs': outputs}
+    pipeline_start = time.perf_counter()
+
+    with _stage('ingest', timings):
+        if data_dir is None:
+            trends = ingest.load_search_trends()
+            stock = ingest.load_stock_prices()
+        else:
+            # Keep the parsed copies next to the CSVs they came from, as ingest does by default
+            cache_dir = os.environ.get('NET_PROPHET_CACHE_DIR', os.path.join(data_dir, '.cache'))
+            trends = ingest.load_search_trends(os.path.join(data_dir, ingest.SEARCH_TRENDS_FILE),
+                                               cache_dir=cache_dir)
+            stock = ingest.load_stock_prices(os.path.join(data_dir, ingest.STOCK_PRICE_FILE),
+                                             cache_dir=cache_dir)
+
+    with _stage('seasonality', timings):
+        profiles = seasonality_profiles(trends)
+        summary['month_summary'] = month_summary(profiles['monthly_traffic'], month)
+        with open(os.path.join(output_dir, 'seasonality.json'), 'w') as f:
+            json.dump({name: _series_to_json(profile) for name, profile in profiles.items()}, f, indent=2)
+        outputs['seasonality'] = f.name
+
+    with _stage('anomalies', timings):
+        events = detect_anomalies(trends[['Search Trends']])
+        summary['top_anomalies'] = events.head(10).to_dict(orient='records')
+        outputs['anomalies'] = _write_frame(events, output_dir, 'anomalies')
+
+    with _stage('features', timings):
+        alignment = {}
+        combined = align_asof(stock, trends, stats=alignment)
+        combined = combined.join(notebook_features(combined))
+        summary['alignment'] = alignment
+        summary['correlation'] = combined[
+            ['Stock Volatility', 'Lagged Search Trends', 'Hourly Stock Return']].corr().to_dict()
+        summary['best_lags'] = best_lags(lag_scan(combined, max_lag=max_lag), top=5).to_dict(orient='records')
+        outputs['features'] = _write_frame(downcast_frame(combined) if compact else combined,
+                                           output_dir, 'features')
+
+    forecast = None
+    if not skip_forecast:
+        with _stage('forecast', timings):
+            from forecasting import quiet_stan_logs
+            from prophet import Prophet
+
+            quiet_stan_logs()
+            prophet_df = trends.reset_index().rename(
+                columns={trends.index.name: 'ds', 'Search Trends': 'y'}).dropna()
+            model = Prophet()
+            with instrumentation.stage('prophet_fit', rows=len(prophet_df)):
+                model.fit(prophet_df)
+            with instrumentation.stage('make_future_dataframe', rows=periods):
+                future = model.make_future_dataframe(periods=periods, freq=freq)
+            with instrumentation.stage('predict', rows=len(future)):
+                forecast = predict_with_intervals(model, future, mode=interval_mode)
+            forecast = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+            if compact:
+                forecast = compact_forecast(forecast)
+            outputs['forecast'] = _write_frame(forecast, output_dir, 'forecast')
+
+    if plot:
+        with _stage('plot', timings):
+            import plotting
+
+            outputs['plots'] = [
+                plotting.plot_search_month(trends, month, os.path.join(output_dir, 'search_month.png')),
+                plotting.plot_seasonality(profiles, os.path.join(output_dir, 'seasonality.png')),
+                plotting.plot_stock_features(combined, os.path.join(output_dir, 'stock_features.png')),
+            ]
+            if forecast is not None:
+                outputs['plots'].append(
+                    plotting.plot_forecast(forecast, os.path.join(output_dir, 'forecast.png'), tail=periods))
+
+    timings['total'] = time.perf_counter() - pipeline_start
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=None,
+                        help='directory holding the two CSVs (default: NET_PROPHET_DATA_DIR or .)')
+    parser.add_argument('--output-dir', default='output')
+    parser.add_argument('--periods', type=int, default=2000, help='forecast horizon in hours')
+    parser.add_argument('--interval-mode', choices=INTERVAL_MODES, default='analytic')
+    parser.add_argument('--month', default='2020-05', help='month to compare against the monthly median')
+    parser.add_argument('--max-lag', type=int, default=168, help='largest lag to scan, in hours')
+    parser.add_argument('--skip-forecast', action='store_true')
+    parser.add_argument('--plot', action='store_true', help='also write PNG plots (loads matplotlib)')
+    parser.add_argument('--compact', action='store_true', help='write float32 / small-integer outputs')
+    parser.add_argument('--metrics', help='write per-stage metrics to this Prometheus text file')
+    parser.add_argument('--instrument-log', help='append per-stage records to this JSON-lines file')
+    parser.add_argument('--trace-memory', action='store_true', help='also record tracemalloc deltas')
+    args = parser.parse_args(argv)
+
+    if args.metrics or args.instrument_log or args.trace_memory:
+        instrumentation.configure(enabled=True, trace_memory=args.trace_memory, log_path=args.instrument_log)
+
+    summary = run_pipeline(
+        data_dir=args.data_dir, output_dir=args.output_dir, periods=args.periods,
+        interval_mode=args.interval_mode, month=args.month, max_lag=args.max_lag,
+        skip_forecast=args.skip_forecast, plot=args.plot, compact=args.compact,
+    )
+    for stage, seconds in summary['timings_s'].items():
+        print(f"{stage:>12}: {seconds:.3f}s")
+    if args.metrics:
+        instrumentation.write_prometheus(args.metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Optional plots for the headless pipeline.
+
+matplotlib is only imported when one of these functions is called, and
+with the non-interactive Agg backend, so the pipeline's startup path does
+not pay for it. Each function saves a PNG to ``path`` and returns it.
+"""
+
+
+def _pyplot():
+    import matplotlib
+
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def _save(plt, fig, path):
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def plot_search_month(trends, month, path, column='Search Trends'):
+    """Hourly search traffic for one month, e.g. ``'2020-05'``."""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(12, 6))
+    trends.loc[month, column].plot(ax=ax, title=f"Google Search Trends for {month}")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Trend Value")
+    return _save(plt, fig, path)
+
+
+def plot_seasonality(profiles, path):
+    """Hour x weekday, weekday and ISO week profiles from ``seasonality_profiles``."""
+    plt = _pyplot()
+    fig, axes = plt.subplots(3, 1, figsize=(12, 15))
+
+    hourly = profiles['hourly_avg_by_day']
+    hourly.plot(ax=axes[0], title="Average Search Traffic by Day of the Week (Hourly)")
+    axes[0].set_xlabel("Hour of the Day")
+    axes[0].legend(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"][:hourly.shape[1]],
+                   title="Day of Week")
+
+    profiles['average_traffic_by_isoday'].plot(ax=axes[1], marker='o', title="Average Search Traffic by Day of Week")
+    axes[1].set_xlabel("Day of Week")
+
+    profiles['average_traffic_by_week'].plot(ax=axes[2], marker='o', title="Average Search Traffic by Week of the Year")
+    axes[2].set_xlabel("Week of the Year")
+
+    for ax in axes:
+        ax.set_ylabel("Average Search Traffic")
+        ax.grid()
+    return _save(plt, fig, path)
+
+
+def plot_stock_features(combined, path):
+    """Closing price, search trends and stock volatility on shared time axes."""
+    plt = _pyplot()
+    columns = [c for c in ['close', 'Search Trends', 'Stock Volatility', 'Stock EWM Volatility'] if c in combined]
+    axes = combined[columns].plot(subplots=True, figsize=(12, 3 * len(columns)))
+    fig = axes[0].get_figure()
+    return _save(plt, fig, path)
+
+
+def plot_forecast(forecast, path, tail=2000):
+    """``yhat`` with its interval over the last ``tail`` rows of a forecast frame."""
+    plt = _pyplot()
+    last = forecast.tail(tail)
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot(last['ds'], last['yhat'], label='yhat', color='blue')
+    if last['yhat_lower'].notna().any():
+        ax.fill_between(last['ds'], last['yhat_lower'], last['yhat_upper'],
+                        color='blue', alpha=0.2, label='interval')
+    ax.set_title(f"Prophet Predictions for the Last {tail} Hours")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Trend Value")
+    ax.legend()
+    ax.grid()
+    return _save(plt, fig, path)
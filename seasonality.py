@@ -0,0 +1,180 @@
+"""Single-pass seasonality profiles for hourly series.
+
+Step 2 of the notebook added ``DayOfWeek``, ``Hour``, ``ISO_DayOfWeek`` and
+``ISO_Week`` columns to the search trends frame, called
+``index.isocalendar()`` twice and ran three separate groupbys. Here the
+calendar keys are derived once from the index as small integer arrays, the
+sums and counts for every profile are accumulated with ``np.bincount``,
+and the source frame is left untouched.
+
+``SeasonalityProfiler`` can be updated repeatedly, which is what the
+chunked reader in ``streaming`` uses; ``seasonality_profiles`` is the
+one-shot version for a frame that is already in memory.
+"""
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+
+ISO_DAY_NAMES = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday',
+                 5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
+
+
+def calendar_keys(index):
+    """Derive compact calendar keys from a tz-naive DatetimeIndex.
+
+    Returns a dict of integer arrays: ``dow`` (0 = Monday), ``hour``,
+    ``isoweek`` (1-53) and ``month`` (months since 1970-01, int16, which
+    covers pandas' whole timestamp range). The ISO week
+    is computed directly from the day number instead of through
+    ``isocalendar()``.
+    """
+    stamps = np.asarray(index, dtype='datetime64[ns]')
+    days = stamps.astype('datetime64[D]')
+    day_number = days.astype(np.int64)
+
+    # 1970-01-01 was a Thursday, so shifting by 3 makes Monday 0
+    dow = (day_number + 3) % 7
+    hour = (stamps - days) // np.timedelta64(1, 'h')
+
+    # The ISO week belongs to the year containing that week's Thursday
+    thursday = days + (3 - dow).astype('timedelta64[D]')
+    iso_year_start = thursday.astype('datetime64[Y]').astype('datetime64[D]')
+    isoweek = (thursday - iso_year_start).astype(np.int64) // 7 + 1
+
+    return {
+        'dow': dow.astype(np.int8),
+        'hour': hour.astype(np.int8),
+        'isoweek': isoweek.astype(np.int8),
+        'month': days.astype('datetime64[M]').astype(np.int16),
+    }
+
+
+class SeasonalityProfiler:
+    """Accumulate every seasonality profile of one value column in one pass.
+
+    Each ``update`` derives the calendar keys once and adds to four sets of
+    sums and counts: day of week x hour, ISO week, and calendar month. The
+    day-of-week profile is folded out of the day of week x hour cells, and
+    the month-of-year profile out of the calendar months.
+    """
+
+    def __init__(self, column='Search Trends'):
+        self.column = column
+        self.rows = 0
+        self.dtype = None
+        self.index_name = None
+        # Day of week (0 = Monday) x hour of day
+        self.dow_hour_sum = np.zeros((7, 24))
+        self.dow_hour_count = np.zeros((7, 24), dtype=np.int64)
+        # ISO week (1-53); slot 0 is unused
+        self.isoweek_sum = np.zeros(54)
+        self.isoweek_count = np.zeros(54, dtype=np.int64)
+        # Calendar months, keyed as months since 1970-01
+        self.month_sum = {}
+        self.month_count = {}
+
+    def update(self, chunk):
+        """Add a date-indexed frame (or chunk of one) to the profiles."""
+        if chunk.empty:
+            return
+        if self.dtype is None:
+            self.dtype = chunk[self.column].dtype
+            self.index_name = chunk.index.name
+        values = chunk[self.column].to_numpy(dtype=np.float64)
+        keys = calendar_keys(chunk.index)
+        self.rows += len(values)
+
+        cell = keys['dow'].astype(np.intp) * 24 + keys['hour']
+        self.dow_hour_sum += np.bincount(cell, weights=values, minlength=168).reshape(7, 24)
+        self.dow_hour_count += np.bincount(cell, minlength=168).reshape(7, 24)
+
+        week = keys['isoweek'].astype(np.intp)
+        self.isoweek_sum += np.bincount(week, weights=values, minlength=54)
+        self.isoweek_count += np.bincount(week, minlength=54)
+
+        first = int(keys['month'].min())
+        month = keys['month'].astype(np.intp) - first
+        sums = np.bincount(month, weights=values)
+        counts = np.bincount(month)
+        for offset in np.flatnonzero(counts):
+            key = first + int(offset)
+            self.month_sum[key] = self.month_sum.get(key, 0.0) + sums[offset]
+            self.month_count[key] = self.month_count.get(key, 0) + int(counts[offset])
+
+    def _cast(self, sums):
+        if self.dtype is not None and np.issubdtype(self.dtype, np.integer):
+            return np.rint(sums).astype(self.dtype)
+        return sums
+
+    def hourly_avg_by_day(self):
+        """Hour x day-of-week means, matching the notebook's unstacked groupby."""
+        seen = self.dow_hour_count > 0
+        means = np.full((7, 24), np.nan)
+        means[seen] = self.dow_hour_sum[seen] / self.dow_hour_count[seen]
+        days = np.flatnonzero(seen.any(axis=1))
+        hours = np.flatnonzero(seen.any(axis=0))
+        return pd.DataFrame(
+            means[np.ix_(days, hours)].T,
+            index=pd.Index(hours.astype(np.int32), name='Hour'),
+            columns=pd.Index(days.astype(np.int32), name='DayOfWeek'),
+        )
+
+    def average_traffic_by_isoday(self, day_names=True):
+        """Mean traffic per ISO day of week, keyed by day name by default."""
+        sums = self.dow_hour_sum.sum(axis=1)
+        counts = self.dow_hour_count.sum(axis=1)
+        days = np.flatnonzero(counts)
+        index = pd.Index(days + 1, dtype='UInt32', name='ISO_DayOfWeek')
+        if day_names:
+            index = index.map(ISO_DAY_NAMES)
+        return pd.Series(sums[days] / counts[days], index=index, name=self.column)
+
+    def average_traffic_by_week(self):
+        """Mean traffic per ISO week of the year."""
+        weeks = np.flatnonzero(self.isoweek_count)
+        means = self.isoweek_sum[weeks] / self.isoweek_count[weeks]
+        index = pd.Index(weeks, dtype='UInt32', name='ISO_Week')
+        return pd.Series(means, index=index, name=self.column)
+
+    def monthly_traffic(self):
+        """Monthly totals, matching ``df.resample('M')[column].sum()``."""
+        if not self.month_sum:
+            return pd.Series([], dtype=np.float64, name=self.column)
+        first, last = min(self.month_sum), max(self.month_sum)
+        sums = np.array([self.month_sum.get(k, 0.0) for k in range(first, last + 1)])
+        start = pd.Timestamp(np.datetime64(first, 'M'))
+        index = pd.date_range(start, periods=len(sums), freq=pd.offsets.MonthEnd(),
+                              name=self.index_name)
+        return pd.Series(self._cast(sums), index=index, name=self.column)
+
+    def average_traffic_by_month(self):
+        """Mean traffic per month of the year (1 = January)."""
+        sums = np.zeros(13)
+        counts = np.zeros(13, dtype=np.int64)
+        for key, total in self.month_sum.items():
+            sums[key % 12 + 1] += total
+            counts[key % 12 + 1] += self.month_count[key]
+        months = np.flatnonzero(counts)
+        index = pd.Index(months, dtype=np.int32, name='Month')
+        return pd.Series(sums[months] / counts[months], index=index, name=self.column)
+
+    def profiles(self):
+        """Return every profile in a dict keyed by the notebook's variable names."""
+        return {
+            'hourly_avg_by_day': self.hourly_avg_by_day(),
+            'average_traffic_by_isoday': self.average_traffic_by_isoday(),
+            'average_traffic_by_week': self.average_traffic_by_week(),
+            'average_traffic_by_month': self.average_traffic_by_month(),
+            'monthly_traffic': self.monthly_traffic(),
+        }
+
+
+def seasonality_profiles(df, column='Search Trends'):
+    """Compute all seasonality profiles of ``df[column]`` in a single pass."""
+    with stage('seasonality_profiles', rows=len(df)):
+        profiler = SeasonalityProfiler(column)
+        profiler.update(df)
+        return profiler.profiles()
@@ -0,0 +1,438 @@
+"""Long-running forecast scoring service.
+
+Fitted Prophet models are loaded once from their JSON files (see
+``incremental.save_model``) and kept in memory. New hourly observations
+are appended with ``POST /observe`` and moved the forecast origin forward
+without a refit; ``POST /refit`` warm-starts a refit on the history plus
+those observations in a background thread and swaps the model in when it
+is done.
+
+``POST /forecast`` requests are not answered one by one. They go into a
+queue, and a batcher collects everything that arrives within
+``batch_window_s`` (up to ``max_batch`` requests). Requests for the same
+series and origin are coalesced: the forecast is computed once, for the
+longest horizon asked for, with one vectorized ``predict`` call, and each
+request gets its slice. The last forecast per series and origin is also
+kept, so repeated queries within the same hour cost nothing. ``GET
+/metrics`` reports p50/p99 latencies per endpoint and the coalescing
+counts.
+
+The HTTP/1.1 handling is a small subset (JSON bodies, keep-alive) written
+on ``asyncio.start_server``, so the service has no dependencies beyond
+Prophet. ``ServiceClient`` is the matching local client, and
+``load_test`` fires concurrent forecast requests at a running service.
+
+Usage::
+
+    python service.py models/*.json --port 8765
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+from incremental import load_model, refit
+from intervals import predict_with_intervals
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            500: 'Internal Server Error'}
+
+
+class ServiceError(Exception):
+    """A request the service cannot answer; carries the HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _Series:
+    # One served model and the observations appended since it was fitted
+    def __init__(self, model):
+        self.model = model
+        self.version = 0
+        self.observations = pd.DataFrame({'ds': pd.Series(dtype='datetime64[ns]'),
+                                          'y': pd.Series(dtype=np.float64)})
+        self.refitting = False
+        # predict_with_intervals briefly changes model attributes, so one predict per model at a time
+        self.lock = asyncio.Lock()
+
+    @property
+    def origin(self):
+        last = self.model.history['ds'].iloc[-1]
+        if len(self.observations):
+            last = max(last, self.observations['ds'].iloc[-1])
+        return pd.Timestamp(last)
+
+
+class LatencyTracker:
+    """Rolling latency samples per endpoint, summarized as percentiles."""
+
+    def __init__(self, window=10_000):
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+
+    def record(self, endpoint, seconds):
+        self.samples[endpoint].append(seconds)
+        self.counts[endpoint] += 1
+
+    def summary(self):
+        out = {}
+        for endpoint, samples in self.samples.items():
+            values = np.fromiter(samples, dtype=np.float64)
+            out[endpoint] = {
+                'requests': self.counts[endpoint],
+                'p50_ms': float(np.percentile(values, 50) * 1000),
+                'p99_ms': float(np.percentile(values, 99) * 1000),
+                'max_ms': float(values.max() * 1000),
+            }
+        return out
+
+
+class ScoringService:
+    """Serve forecasts from in-memory Prophet models over local HTTP.
+
+    ``models`` maps series ids to fitted models or to paths of their JSON
+    files. ``interval_mode`` is passed to ``predict_with_intervals``.
+    """
+
+    def __init__(self, models, freq='h', interval_mode='analytic', batch_window_s=0.005,
+                 max_batch=256, cache_entries=1024):
+        self.series = {}
+        for series_id, model in models.items():
+            self.series[series_id] = _Series(load_model(model) if isinstance(model, str) else model)
+        self.freq = freq
+        self.interval_mode = interval_mode
+        self.batch_window_s = batch_window_s
+        self.max_batch = max_batch
+        self.cache_entries = cache_entries
+        self.latency = LatencyTracker()
+        self.counters = {'batches': 0, 'forecast_requests': 0, 'predictions': 0, 'cache_hits': 0}
+        self._cache = OrderedDict()
+        self._queue = None
+        self._batcher = None
+        self._server = None
+
+    # -- lifecycle
+
+    async def start(self, host='127.0.0.1', port=8765):
+        """Start listening; returns the bound ``(host, port)`` (``port=0`` picks a free one)."""
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._batch_loop())
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+
+    async def serve_forever(self, host='127.0.0.1', port=8765):
+        await self.start(host, port)
+        async with self._server:
+            await self._server.serve_forever()
+
+    # -- operations
+
+    def _get(self, series_id):
+        try:
+            return self.series[series_id]
+        except KeyError:
+            raise ServiceError(404, f'Unknown series {series_id!r}') from None
+
+    async def forecast(self, series_id, horizon):
+        """Forecast ``horizon`` steps after the latest observation of ``series_id``."""
+        self._get(series_id)
+        if not isinstance(horizon, int) or horizon < 1:
+            raise ServiceError(400, 'horizon must be a positive integer')
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((series_id, horizon, future))
+        return await future
+
+    def observe(self, series_id, ds, y):
+        """Append observations to ``series_id``; newer ones move the forecast origin."""
+        entry = self._get(series_id)
+        if len(ds) != len(y):
+            raise ServiceError(400, 'ds and y must have the same length')
+        new = pd.DataFrame({'ds': pd.to_datetime(ds), 'y': np.asarray(y, dtype=np.float64)})
+        combined = pd.concat([entry.observations, new], ignore_index=True)
+        entry.observations = (combined.drop_duplicates('ds', keep='last')
+                              .sort_values('ds', ignore_index=True))
+        return {'series_id': series_id, 'observations': len(entry.observations),
+                'origin': entry.origin.isoformat()}
+
+    async def refit(self, series_id):
+        """Warm-start a refit on the history plus the appended observations."""
+        entry = self._get(series_id)
+        if entry.refitting:
+            raise ServiceError(400, f'Series {series_id!r} is already being refitted')
+        history = entry.model.history[['ds', 'y']]
+        new = entry.observations[entry.observations['ds'] > history['ds'].iloc[-1]]
+        df = pd.concat([history, new], ignore_index=True)
+        entry.refitting = True
+        try:
+            async with entry.lock:
+                uncertainty_samples = entry.model.uncertainty_samples
+            model = await asyncio.get_running_loop().run_in_executor(None, refit, entry.model, df)
+        finally:
+            entry.refitting = False
+        # The copy may have been taken while a predict had swapped this setting out
+        model.uncertainty_samples = uncertainty_samples
+        entry.model = model
+        entry.version += 1
+        entry.observations = entry.observations[entry.observations['ds'] > df['ds'].iloc[-1]]
+        return {'series_id': series_id, 'version': entry.version, 'rows': len(df)}
+
+    def metrics(self):
+        return {'latency': self.latency.summary(), **self.counters,
+                'series': len(self.series), 'cached_forecasts': len(self._cache)}
+
+    # -- batching
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window_s
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.counters['batches'] += 1
+            self.counters['forecast_requests'] += len(batch)
+
+            # Coalesce by series, model version and origin; compute the longest horizon once
+            groups = defaultdict(list)
+            for series_id, horizon, future in batch:
+                entry = self.series[series_id]
+                groups[(series_id, entry.version, entry.origin)].append((horizon, future))
+            await asyncio.gather(*(self._answer(key, waiting) for key, waiting in groups.items()))
+
+    async def _answer(self, key, waiting):
+        longest = max(horizon for horizon, _ in waiting)
+        try:
+            forecast = await self._forecast_frame(key, longest)
+        except Exception as exc:
+            for _, future in waiting:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for horizon, future in waiting:
+            if not future.done():
+                future.set_result({name: (values if name == 'series_id' else values[:horizon])
+                                   for name, values in forecast.items()})
+
+    async def _forecast_frame(self, key, horizon):
+        # Cached as the JSON-ready payload, so answering a request is just slicing lists
+        cached = self._cache.get(key)
+        if cached is not None and len(cached['ds']) >= horizon:
+            self._cache.move_to_end(key)
+            self.counters['cache_hits'] += 1
+            return cached
+        series_id, _, origin = key
+        entry = self.series[series_id]
+        future = pd.DataFrame({'ds': pd.date_range(origin, periods=horizon + 1, freq=self.freq)[1:]})
+        # predict is CPU-bound; run it off the event loop so connections keep being served
+        async with entry.lock:
+            forecast = await asyncio.get_running_loop().run_in_executor(
+                None, predict_with_intervals, entry.model, future, self.interval_mode)
+        forecast = _forecast_payload(series_id, forecast)
+        self.counters['predictions'] += 1
+        self._cache[key] = forecast
+        if len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+        return forecast
+
+    # -- HTTP
+
+    async def _dispatch(self, method, path, body):
+        if path == '/health':
+            return {'status': 'ok'}
+        if path == '/metrics':
+            return self.metrics()
+        if method != 'POST':
+            raise ServiceError(405 if path in ('/forecast', '/observe', '/refit') else 404, path)
+        if path == '/forecast':
+            return await self.forecast(body.get('series_id'), body.get('horizon', 24))
+        if path == '/observe':
+            return self.observe(body.get('series_id'), body.get('ds', []), body.get('y', []))
+        if path == '/refit':
+            return await self.refit(body.get('series_id'))
+        raise ServiceError(404, path)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                raw = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                start = time.perf_counter()
+                try:
+                    body = json.loads(raw) if raw else {}
+                    status, payload = 200, await self._dispatch(method, path, body)
+                except ServiceError as exc:
+                    status, payload = exc.status, {'error': str(exc)}
+                except (ValueError, TypeError) as exc:
+                    status, payload = 400, {'error': str(exc)}
+                except Exception as exc:
+                    status, payload = 500, {'error': f'{type(exc).__name__}: {exc}'}
+                self.latency.record(path, time.perf_counter() - start)
+
+                data = json.dumps(payload).encode()
+                writer.write(f'HTTP/1.1 {status} {_REASONS.get(status, "")}\r\n'
+                             f'Content-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def _forecast_payload(series_id, forecast):
+    return {
+        'series_id': series_id,
+        'ds': forecast['ds'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist(),
+        'yhat': forecast['yhat'].tolist(),
+        'yhat_lower': forecast['yhat_lower'].tolist(),
+        'yhat_upper': forecast['yhat_upper'].tolist(),
+    }
+
+
+class ServiceClient:
+    """Minimal keep-alive JSON client for a running ``ScoringService``.
+
+    One request is in flight per client; open several clients for
+    concurrent requests.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765):
+        self.host = host
+        self.port = port
+        self._reader = self._writer = None
+
+    async def request(self, method, path, payload=None):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        data = b'' if payload is None else json.dumps(payload).encode()
+        self._writer.write(f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+                           f'Content-Type: application/json\r\n'
+                           f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+        await self._writer.drain()
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        body = json.loads(await self._reader.readexactly(length))
+        if status != 200:
+            raise ServiceError(status, body.get('error', ''))
+        return body
+
+    async def forecast(self, series_id, horizon=24):
+        return await self.request('POST', '/forecast', {'series_id': series_id, 'horizon': horizon})
+
+    async def observe(self, series_id, ds, y):
+        ds = [pd.Timestamp(d).isoformat() for d in ds]
+        return await self.request('POST', '/observe', {'series_id': series_id, 'ds': ds,
+                                                       'y': [float(v) for v in y]})
+
+    async def refit(self, series_id):
+        return await self.request('POST', '/refit', {'series_id': series_id})
+
+    async def metrics(self):
+        return await self.request('GET', '/metrics')
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._reader = self._writer = None
+
+
+async def load_test(host, port, series_ids, requests=1000, concurrency=32, horizon=24):
+    """Send ``requests`` forecast queries from ``concurrency`` clients.
+
+    Returns the client-side p50/p99 latency in milliseconds and the
+    throughput in requests per second.
+    """
+    latencies = []
+    counter = iter(range(requests))
+
+    async def worker():
+        client = ServiceClient(host, port)
+        try:
+            for i in counter:
+                start = time.perf_counter()
+                await client.forecast(series_ids[i % len(series_ids)], horizon)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_s = time.perf_counter() - start
+    values = np.array(latencies)
+    return {'requests': len(values), 'wall_s': wall_s, 'requests_per_s': len(values) / wall_s,
+            'p50_ms': float(np.percentile(values, 50) * 1000),
+            'p99_ms': float(np.percentile(values, 99) * 1000)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('models', nargs='+', help='model JSON files; the file name is the series id')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--freq', default='h')
+    parser.add_argument('--interval-mode', default='analytic')
+    parser.add_argument('--batch-window-ms', type=float, default=5.0)
+    parser.add_argument('--design-cache', help='directory of the shared Fourier feature cache')
+    args = parser.parse_args(argv)
+
+    from forecasting import quiet_stan_logs
+
+    quiet_stan_logs()
+    if args.design_cache:
+        from design_cache import install
+
+        install(args.design_cache)
+    models = {os.path.splitext(os.path.basename(path))[0]: path for path in args.models}
+    service = ScoringService(models, freq=args.freq, interval_mode=args.interval_mode,
+                             batch_window_s=args.batch_window_ms / 1000)
+    print(f'serving {len(models)} models on http://{args.host}:{args.port}')
+    asyncio.run(service.serve_forever(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Chunked, bounded-memory aggregation of the hourly search trends.
+
+The notebook loads the whole search trends CSV and then computes the
+monthly totals, the day-of-week x hour means and the ISO week means on the
+full frame. For feeds that do not fit in memory, ``stream_search_trends``
+reads the CSV in chunks and keeps only running sums and counts, so memory
+use depends on the number of calendar buckets, not on the number of rows.
+
+The sums are accumulated in float64 and cast back to the column dtype at
+the end, so for integer search counts (as in the source data) the results
+are identical to the in-memory pandas ones.
+"""
+
+import pandas as pd
+
+from seasonality import SeasonalityProfiler
+
+
+# The running accumulators are the same ones the in-memory profiler uses
+StreamingAggregates = SeasonalityProfiler
+
+
+def stream_search_trends(path, chunksize=1_000_000, index_col='Date', column='Search Trends'):
+    """Aggregate a search trends CSV chunk by chunk.
+
+    Each chunk is parsed and cleaned the same way the notebook cleans the
+    whole file (dates parsed from ``index_col``, rows with missing values
+    dropped). Returns the filled ``StreamingAggregates``.
+    """
+    aggregates = StreamingAggregates(column)
+    reader = pd.read_csv(path, index_col=index_col, parse_dates=True, chunksize=chunksize)
+    for chunk in reader:
+        aggregates.update(chunk.dropna())
+    return aggregates
@@ -0,0 +1,175 @@
+"""Parallel hyperparameter search for the Prophet search trends model.
+
+The notebook fits ``Prophet()`` with its defaults even though Step 2 shows
+strong daily and weekly patterns. ``tune`` searches
+``changepoint_prior_scale``, ``seasonality_prior_scale``,
+``seasonality_mode`` and the daily/weekly Fourier orders, scoring each
+configuration with the rolling-origin folds from ``backtest``.
+
+The search uses successive halving: every configuration is first scored
+on the most recent fold only, the best ``1 / eta`` of them go on to more
+folds, and so on until the survivors have been scored on every fold. Poor
+configurations are therefore dropped after a partial backtest. Folds run
+in a process pool, at most one per worker at a time. Once the finished
+folds have used ``cpu_budget_s`` CPU-seconds (Stan's child processes
+included), no further fold is submitted and the folds already running
+are allowed to finish. A configuration whose fold fails is dropped from
+the search and reported as ``'failed'``.
+"""
+
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from backtest import SCORES, failed_fold, init_fold_worker, prepare_folds, run_fold
+
+
+DEFAULT_GRID = {
+    'changepoint_prior_scale': [0.001, 0.01, 0.05, 0.1, 0.5],
+    'seasonality_prior_scale': [0.1, 1.0, 10.0],
+    'seasonality_mode': ['additive', 'multiplicative'],
+    'daily_seasonality': [4, 10, 20],
+    'weekly_seasonality': [3, 6],
+}
+
+
+def grid_configs(grid=None, max_configs=None, seed=0):
+    """Every combination of ``grid`` values, or a random sample of ``max_configs`` of them."""
+    grid = DEFAULT_GRID if grid is None else grid
+    names = list(grid)
+    configs = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    if max_configs is not None and max_configs < len(configs):
+        configs = random.Random(seed).sample(configs, max_configs)
+    return configs
+
+
+def _rungs(n_folds, eta):
+    # Fold counts per rung: 1, eta, eta**2, ... and finally every fold
+    rungs = []
+    count = 1
+    while count < n_folds:
+        rungs.append(count)
+        count *= eta
+    return rungs + [n_folds]
+
+
+def tune(df, grid=None, configs=None, horizon='2000h', initial=None, period=None, eta=3,
+         metric='mae', max_workers=None, cpu_budget_s=None, interval_mode='analytic',
+         design_cache=None):
+    """Successive-halving search over Prophet configurations.
+
+    Returns a leaderboard frame with one row per configuration: its
+    settings, the mean of each score over the folds it reached, the
+    number of ``folds`` scored, its ``cpu_s``, a ``status``
+    (``'complete'``, ``'eliminated'``, ``'budget'`` or ``'failed'``) and
+    the ``error`` of a failed configuration. Rows are ordered
+    by folds reached, then by ``metric``, so the first row is the best
+    configuration among those scored on the most folds.
+    """
+    configs = grid_configs(grid) if configs is None else configs
+    df, windows = prepare_folds(df, horizon, initial, period)
+    # Most recent folds first, so the first rung scores the freshest data
+    windows = windows[::-1]
+    results = {i: [] for i in range(len(configs))}
+    status = {i: 'eliminated' for i in range(len(configs))}
+    errors = {}
+    alive = list(range(len(configs)))
+    cpu_used = 0.0
+    max_workers = max_workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_fold_worker,
+                             initargs=(df, None, interval_mode, design_cache)) as pool:
+        for n_folds in _rungs(len(windows), eta):
+            tasks = iter([(i, fold) for i in alive for fold in range(len(results[i]), n_folds)])
+            pending = {}
+
+            def submit_next():
+                # The pool queues whatever it is given, so the budget is checked before each submit
+                if cpu_budget_s is not None and cpu_used >= cpu_budget_s:
+                    return False
+                for i, fold in tasks:
+                    if i in errors:
+                        continue
+                    future = pool.submit(run_fold, fold, *windows[fold], configs[i])
+                    pending[future] = (i, fold)
+                    return True
+                return False
+
+            while len(pending) < max_workers and submit_next():
+                pass
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i, fold = pending.pop(future)
+                    try:
+                        row = future.result()
+                    except Exception as exc:
+                        row = failed_fold(df, fold, *windows[fold], exc)
+                    cpu_used += np.nan_to_num(row['cpu_s'])
+                    if row['error'] is not None:
+                        errors.setdefault(i, row['error'])
+                    else:
+                        results[i].append(row)
+                    submit_next()
+
+            for i in errors:
+                status[i] = 'failed'
+            alive = [i for i in alive if i not in errors]
+            if any(len(results[i]) < n_folds for i in alive):
+                for i in alive:
+                    status[i] = 'budget'
+                break
+            if not alive:
+                break
+
+            scores = {i: np.mean([row[metric] for row in results[i]]) for i in alive}
+            if n_folds == len(windows):
+                for i in alive:
+                    status[i] = 'complete'
+                break
+            keep = max(1, len(alive) // eta)
+            alive = sorted(alive, key=scores.get)[:keep]
+
+    rows = []
+    for i, config in enumerate(configs):
+        folds = results[i]
+        row = {**config, 'folds': len(folds), 'status': status[i],
+               'cpu_s': sum(r['cpu_s'] for r in folds), 'error': errors.get(i)}
+        for score in SCORES:
+            row[score] = np.mean([r[score] for r in folds]) if folds else np.nan
+        rows.append(row)
+    leaderboard = pd.DataFrame(rows).sort_values(['folds', metric], ascending=[False, True])
+    leaderboard.attrs['cpu_used_s'] = cpu_used
+    return leaderboard.reset_index(drop=True)
+
+
+def write_results(leaderboard, output_dir, grid_names=None):
+    """Write ``leaderboard.csv`` and ``best_config.json`` to ``output_dir``."""
+    os.makedirs(output_dir, exist_ok=True)
+    leaderboard.to_csv(os.path.join(output_dir, 'leaderboard.csv'), index=False)
+    names = list(DEFAULT_GRID) if grid_names is None else grid_names
+    best = leaderboard.iloc[0]
+    config = {name: (best[name].item() if hasattr(best[name], 'item') else best[name]) for name in names}
+    with open(os.path.join(output_dir, 'best_config.json'), 'w') as f:
+        json.dump({'prophet_kwargs': config, 'mae': float(best['mae']), 'folds': int(best['folds'])},
+                  f, indent=2)
+    return config
+
+
+if __name__ == '__main__':
+    from ingest import load_search_trends
+
+    trends = load_search_trends()
+    prophet_df = trends.reset_index().rename(columns={'Date': 'ds', 'Search Trends': 'y'})
+    start = time.perf_counter()
+    leaderboard = tune(prophet_df, cpu_budget_s=3600)
+    best = write_results(leaderboard, 'tuning')
+    print(leaderboard.head(10).to_string(index=False))
+    print(f'best {best}; {leaderboard.attrs["cpu_used_s"]:.0f} CPU-s, '
+          f'{time.perf_counter() - start:.0f}s wall')